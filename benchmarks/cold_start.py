@@ -0,0 +1,150 @@
+"""Cold-start benchmark for lambda_function.handler.
+
+Every scenario runs in a fresh interpreter, the same way a new Lambda
+container would, and records:
+
+  import_ms         time to import lambda_function
+  first_request_ms  time for the first handler() call
+  heavy_modules     heavy dependencies loaded once the first request is done
+
+The default scenarios only reach unroutable endpoints (127.0.0.1:9), so the
+numbers are dominated by import and client construction rather than by
+network latency. Pass --events to replay your own list of
+{"name": ..., "event": ..., "env": {...}} objects.
+
+    python benchmarks/cold_start.py --runs 5
+    python benchmarks/cold_start.py --max-import-ms 150 --json
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from typing import Any, Dict, List
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+EXAMPLES_DIR = os.path.join(REPO_ROOT, "examples")
+HEAVY_MODULES = ("boto3", "botocore", "stripe", "curl_cffi", "email.mime.multipart")
+UNROUTABLE_URL = "http://127.0.0.1:9"
+
+# Dummy configuration so every route gets past its "not configured" checks
+# without talking to real services.
+BASE_ENV = {
+    "STRIPE_API_KEY": "sk_test_benchmark",
+    "STRIPE_WEBHOOK_SECRET": "whsec_benchmark",
+    "SES_FROM_EMAIL": "benchmark@example.com",
+    "AWS_ACCESS_KEY_ID": "benchmark",
+    "AWS_SECRET_ACCESS_KEY": "benchmark",
+    "AWS_DEFAULT_REGION": "us-east-1",
+    "AWS_ENDPOINT_URL": UNROUTABLE_URL,
+    "AWS_MAX_ATTEMPTS": "1",
+    "AWS_EC2_METADATA_DISABLED": "true",
+}
+
+CHILD_CODE = r"""
+import json, sys, time
+scenario = json.loads(sys.stdin.read())
+start = time.perf_counter()
+import lambda_function
+imported = time.perf_counter()
+try:
+    response = lambda_function.handler(scenario["event"], None)
+    status = response.get("statusCode") if isinstance(response, dict) else None
+except Exception as exc:
+    status = type(exc).__name__
+done = time.perf_counter()
+print(json.dumps({
+    "import_ms": (imported - start) * 1000,
+    "first_request_ms": (done - imported) * 1000,
+    "status": status,
+    "heavy_modules": sorted(m for m in scenario["heavy_modules"] if m in sys.modules),
+}))
+"""
+
+
+def _load_example(name: str) -> Dict[str, Any]:
+    with open(os.path.join(EXAMPLES_DIR, name), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def default_scenarios() -> List[Dict[str, Any]]:
+    return [
+        {"name": "import_only", "event": {"action": "unknown_action"}},
+        {"name": "create_checkout_session", "event": {"action": "create_checkout_session", "payload": _load_example("invoker_payload.json")}},
+        {"name": "stripe_webhook", "event": _load_example("webhook_event.json")},
+        {"name": "get_muinmos_question", "event": {"action": "get_muinmos_question", "payload": {"base_api_url": UNROUTABLE_URL, "assessment_id": "benchmark"}}},
+        {"name": "get_muinmos_assessment_result", "event": {"action": "get_muinmos_assessment_result", "payload": {"base_api_url": UNROUTABLE_URL, "token_type": "Bearer", "access_token": "benchmark", "assessment_id": "benchmark"}}},
+        {"name": "send_email", "event": {"action": "send_email", "payload": {"to_email": "to@example.com", "subject": "Benchmark", "body": "Benchmark"}}},
+        {"name": "muinmos_callback_directly", "event": {"routeKey": "POST /muinmosCallbackDirectly", "headers": {}, "body": "{}"}},
+    ]
+
+
+def run_once(scenario: Dict[str, Any]) -> Dict[str, Any]:
+    env = dict(os.environ)
+    env.update(BASE_ENV)
+    env.update(scenario.get("env") or {})
+    env["PYTHONPATH"] = REPO_ROOT + os.pathsep + env.get("PYTHONPATH", "")
+    child_input = json.dumps({"event": scenario["event"], "heavy_modules": HEAVY_MODULES})
+    proc = subprocess.run(
+        [sys.executable, "-c", CHILD_CODE],
+        input=child_input,
+        capture_output=True,
+        text=True,
+        cwd=REPO_ROOT,
+        env=env,
+        timeout=120,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"{scenario['name']} failed:\n{proc.stderr}")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def run(scenarios: List[Dict[str, Any]], runs: int) -> List[Dict[str, Any]]:
+    report = []
+    for scenario in scenarios:
+        samples = [run_once(scenario) for _ in range(runs)]
+        report.append({
+            "name": scenario["name"],
+            "runs": runs,
+            "import_ms": statistics.median(s["import_ms"] for s in samples),
+            "first_request_ms": statistics.median(s["first_request_ms"] for s in samples),
+            "status": samples[-1]["status"],
+            "heavy_modules": samples[-1]["heavy_modules"],
+        })
+    return report
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters per scenario (median is reported)")
+    parser.add_argument("--events", help="JSON file with a list of {name, event, env} scenarios")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    parser.add_argument("--max-import-ms", type=float, help="exit non-zero if any median import time exceeds this")
+    args = parser.parse_args()
+
+    if args.events:
+        with open(args.events, "r", encoding="utf-8") as f:
+            scenarios = json.load(f)
+    else:
+        scenarios = default_scenarios()
+
+    report = run(scenarios, max(1, args.runs))
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"{'scenario':<32} {'import ms':>10} {'first req ms':>13} {'status':>8}  heavy modules")
+        for row in report:
+            print(f"{row['name']:<32} {row['import_ms']:>10.1f} {row['first_request_ms']:>13.1f} {str(row['status']):>8}  {', '.join(row['heavy_modules']) or '-'}")
+
+    if args.max_import_ms is not None:
+        slow = [row["name"] for row in report if row["import_ms"] > args.max_import_ms]
+        if slow:
+            print(f"import time above {args.max_import_ms} ms: {', '.join(slow)}", file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
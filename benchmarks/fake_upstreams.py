@@ -0,0 +1,196 @@
+"""Local stand-ins for the services lambda_function talks to.
+
+FakeUpstreamServer answers the Stripe, Muinmos and reCAPTCHA endpoints used
+by main.py from one keep-alive HTTP server on 127.0.0.1, with configurable
+latency and KYC PDF size. StubAwsClient replaces the boto3 SES and Lambda
+clients and is injected into main._aws_clients, so boto3 is never imported.
+
+    python benchmarks/fake_upstreams.py --port 8099 --pdf-kb 2048 --pdf-latency-ms 800
+"""
+from __future__ import annotations
+import argparse
+import itertools
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional, Tuple
+
+_ASSESSMENT_PATH = re.compile(r"^/api/assessment/([^/]+)$")
+_QUESTION_PATH = re.compile(r"^/api/assessment/([^/]+)/question$")
+
+
+class FakeUpstreamServer:
+    """Threaded HTTP server for the Stripe, Muinmos and reCAPTCHA endpoints"""
+
+    def __init__(self, port: int = 0, latency_ms: float = 20, pdf_kb: int = 512, pdf_latency_ms: float = 300, search_total: int = 500) -> None:
+        self.latency = latency_ms / 1000
+        self.pdf_latency = pdf_latency_ms / 1000
+        self.pdf = b"%PDF-1.4\n" + b"0" * max(0, pdf_kb * 1024 - 9)
+        self.search_total = search_total
+        self._ids = itertools.count(1)
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeUpstreamServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "FakeUpstreamServer":
+        return self.start()
+
+    def __exit__(self, *exc: Any) -> None:
+        self.stop()
+
+    def respond(self, method: str, path: str, body: bytes) -> Tuple[int, str, bytes, float]:
+        """Return (status, content type, body, delay seconds) for one request"""
+        if method == "POST" and path == "/v1/checkout/sessions":
+            session_id = f"cs_test_{next(self._ids)}"
+            return 200, "application/json", _json({"id": session_id, "object": "checkout.session", "url": f"https://checkout.stripe.com/c/pay/{session_id}"}), self.latency
+        if method == "POST" and path == "/recaptcha/api/siteverify":
+            return 200, "application/json", _json({"success": True, "hostname": "localhost"}), self.latency
+        if method == "POST" and path == "/connect/token":
+            return 200, "application/json", _json({"access_token": "benchmark", "token_type": "Bearer", "expires_in": 3600}), self.latency
+        if method == "POST" and path == "/api/assessment/KYCpdf":
+            return 200, "application/pdf", self.pdf, self.pdf_latency
+        if method == "POST" and path == "/api/assessment/Search":
+            return 200, "application/json", _json(self._search_page(body)), self.latency
+        if method == "POST" and path == "/api/assessment":
+            return 200, "text/plain", f"assessment-{next(self._ids)}".encode(), self.latency
+
+        match = _QUESTION_PATH.match(path)
+        if match and method == "GET":
+            return 200, "application/json", _json({"assessmentId": match.group(1), "questions": [{"id": n, "text": f"Question {n}"} for n in range(10)]}), self.latency
+        if match and method == "POST":
+            return 200, "application/json", _json({"assessmentId": match.group(1), "accepted": True}), self.latency
+
+        match = _ASSESSMENT_PATH.match(path)
+        if match and method == "GET":
+            return 200, "application/json", _json(_assessment(match.group(1))), self.latency
+
+        return 404, "application/json", _json({"error": f"No fake for {method} {path}"}), 0
+
+    def _search_page(self, body: bytes) -> Dict[str, Any]:
+        request = json.loads(body or b"{}")
+        page_size = int(request.get("pageSize") or 50)
+        page_number = int(request.get("pageNumber") or 1)
+        start = (page_number - 1) * page_size
+        items = [
+            {"id": f"assessment-{n}", "referenceKey": f"ORDER-{n}", "state": "Completed", "lastModified": "2024-01-01T00:00:00Z"}
+            for n in range(start, min(start + page_size, self.search_total))
+        ]
+        return {"items": items, "totalCount": self.search_total}
+
+    def _handler_class(self) -> type:
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body go out in separate writes; without TCP_NODELAY
+            # every keep-alive response would stall on delayed ACKs.
+            disable_nagle_algorithm = True
+
+            def _serve(self) -> None:
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                status, content_type, data, delay = fake.respond(self.command, self.path.split("?", 1)[0], body)
+                if delay:
+                    time.sleep(delay)
+                try:
+                    self.send_response(status)
+                    self.send_header("Content-Type", content_type)
+                    self.send_header("Content-Length", str(len(data)))
+                    self.end_headers()
+                    self.wfile.write(data)
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client gave up, e.g. its timeout was capped by the invocation deadline
+                    self.close_connection = True
+
+            do_GET = _serve
+            do_POST = _serve
+
+            def log_message(self, format: str, *args: Any) -> None:
+                pass
+
+        return Handler
+
+
+class StubAwsClient:
+    """Minimal boto3 client stand-in for SES and Lambda with a fixed latency"""
+
+    def __init__(self, service_name: str, latency_ms: float = 15) -> None:
+        self.service_name = service_name
+        self.latency = latency_ms / 1000
+        self._ids = itertools.count(1)
+
+    def _reply(self, status: int = 200, **fields: Any) -> Dict[str, Any]:
+        if self.latency:
+            time.sleep(self.latency)
+        return {"ResponseMetadata": {"HTTPStatusCode": status}, **fields}
+
+    def send_email(self, **kwargs: Any) -> Dict[str, Any]:
+        return self._reply(MessageId=f"stub-{next(self._ids)}")
+
+    def send_raw_email(self, **kwargs: Any) -> Dict[str, Any]:
+        return self._reply(MessageId=f"stub-{next(self._ids)}")
+
+    def invoke(self, **kwargs: Any) -> Dict[str, Any]:
+        status = 202 if kwargs.get("InvocationType") == "Event" else 200
+        return self._reply(status, StatusCode=status)
+
+
+def install_stub_aws_clients(main_module: Any, latency_ms: float = 15) -> None:
+    """Pre-populate main's client registry so no real boto3 client is created"""
+    main_module._aws_clients[("ses", main_module.APP_AWS_REGION)] = StubAwsClient("ses", latency_ms)
+    main_module._aws_clients[("lambda", None)] = StubAwsClient("lambda", latency_ms)
+
+
+def _json(value: Any) -> bytes:
+    return json.dumps(value).encode("utf-8")
+
+
+def _assessment(assessment_id: str) -> Dict[str, Any]:
+    tags = (("FirstName", "Ada"), ("MiddleName", "B"), ("LastName", "Lovelace"), ("DOB", "1815-12-10"))
+    return {
+        "id": assessment_id,
+        "referenceKey": f"ORDER-{assessment_id}",
+        "state": "Completed",
+        "completedTime": "2024-01-01T00:00:00Z",
+        "mCheck": {"individual": {"ragResults": [{"ragResult": "Green"}]}},
+        "detailedResponses": [{
+            "responses": [{"responses": [{"response": value, "tags": [{"name": name}]}]} for name, value in tags]
+        }],
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--latency-ms", type=float, default=20, help="delay for ordinary JSON endpoints")
+    parser.add_argument("--pdf-kb", type=int, default=512, help="size of each KYC PDF")
+    parser.add_argument("--pdf-latency-ms", type=float, default=300, help="delay before a KYC PDF is returned")
+    parser.add_argument("--search-total", type=int, default=500, help="assessments returned by Search across all pages")
+    args = parser.parse_args()
+
+    server = FakeUpstreamServer(args.port, args.latency_ms, args.pdf_kb, args.pdf_latency_ms, args.search_total)
+    print(f"serving fake Stripe/Muinmos/reCAPTCHA on {server.url}")
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
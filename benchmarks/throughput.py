@@ -0,0 +1,291 @@
+"""Offline throughput and latency benchmark for lambda_function.handler.
+
+Starts the fake Stripe/Muinmos/reCAPTCHA server from fake_upstreams.py,
+stubs the SES and Lambda clients, and replays events through handler() in a
+fresh interpreter. For every action it reports:
+
+  rps        requests per second of handler time spent on that action
+  p50/95/99  handler latency in milliseconds
+  peak RSS   maximum resident set size of the interpreter that ran it
+
+By default each action runs in its own interpreter so peak RSS is
+attributable. --mixed replays one weighted mix of all actions in a single
+interpreter instead, which is closer to a warm production container.
+
+    python benchmarks/throughput.py --requests 200
+    python benchmarks/throughput.py --mixed --requests 2000 --json
+    python benchmarks/throughput.py --actions send_muinmos_assessment_kycpdf --pdf-kb 4096 --pdf-latency-ms 1500
+"""
+from __future__ import annotations
+import argparse
+import base64
+import hashlib
+import hmac
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Tuple
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCHMARKS_DIR)
+EXAMPLES_DIR = os.path.join(REPO_ROOT, "examples")
+
+STRIPE_WEBHOOK_SECRET = "whsec_benchmark"
+MUINMOS_API_KEY = "muinmos_benchmark"
+
+BASE_ENV = {
+    "STRIPE_API_KEY": "sk_test_benchmark",
+    "STRIPE_WEBHOOK_SECRET": STRIPE_WEBHOOK_SECRET,
+    "SES_FROM_EMAIL": "benchmark@example.com",
+    "RECAPTCHA_SECRET_KEY": "recaptcha_benchmark",
+    "MUINMOS_API_KEY": MUINMOS_API_KEY,
+    "WEBHOOK_TARGET_LAMBDA_ARN": "arn:aws:lambda:us-east-1:000000000000:function:benchmark",
+    "AWS_DEFAULT_REGION": "us-east-1",
+    "AWS_EC2_METADATA_DISABLED": "true",
+    # Measure the code, not the configured upstream quotas or metric output
+    "SES_MAX_SEND_RATE": "0",
+    "MUINMOS_MAX_REQUEST_RATE": "0",
+    "METRICS_ENABLED": "false",
+}
+
+# Rough production mix: checkout and webhook traffic dominates, bulk jobs are rare
+DEFAULT_WEIGHTS = {
+    "create_checkout_session": 30,
+    "stripe_webhook": 30,
+    "muinmos_callback_directly": 10,
+    "get_muinmos_assessment_result": 10,
+    "get_muinmos_question": 5,
+    "send_email": 5,
+    "submit_contact_us": 5,
+    "muinmos_assessment_search": 2,
+    "send_muinmos_assessment_kycpdf": 2,
+    "get_muinmos_token": 1,
+}
+
+
+def _load_example(name: str) -> Dict[str, Any]:
+    with open(os.path.join(EXAMPLES_DIR, name), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _muinmos_auth(url: str) -> Dict[str, Any]:
+    return {"base_api_url": url, "token_type": "Bearer", "access_token": "benchmark"}
+
+
+def _stripe_webhook_event(n: int, url: str) -> Dict[str, Any]:
+    event = _load_example("webhook_event.json")
+    body = json.loads(event["body"])
+    body["id"] = f"evt_bench_{n}"
+    body["data"]["object"]["id"] = f"cs_test_bench_{n}"
+    payload = json.dumps(body, separators=(",", ":"))
+    timestamp = int(time.time())
+    signature = hmac.new(STRIPE_WEBHOOK_SECRET.encode(), f"{timestamp}.{payload}".encode(), hashlib.sha256).hexdigest()
+    return {**event, "headers": {**event["headers"], "stripe-signature": f"t={timestamp},v1={signature}"}, "body": payload}
+
+
+def _muinmos_callback_event(n: int, url: str) -> Dict[str, Any]:
+    body = json.dumps({"organisationId": "bench", "profileId": "bench", "notificationType": "0", "id": f"assessment-cb-{n}", "referenceKey": f"ORDER-{n}"})
+    signature = base64.b64encode(hmac.new(MUINMOS_API_KEY.encode(), body.encode(), hashlib.sha256).digest()).decode()
+    return {"routeKey": "POST /muinmosCallbackDirectly", "headers": {"x-pass-hmac": signature}, "body": body}
+
+
+def _checkout_event(n: int, url: str) -> Dict[str, Any]:
+    payload = _load_example("invoker_payload.json")
+    payload["metadata"] = {"order_id": f"ORDER-{n}"}
+    return {"action": "create_checkout_session", "payload": payload}
+
+
+# action name -> factory(sequence number, fake upstream URL) -> Lambda event
+EVENTS: Dict[str, Callable[[int, str], Dict[str, Any]]] = {
+    "create_checkout_session": _checkout_event,
+    "stripe_webhook": _stripe_webhook_event,
+    "muinmos_callback_directly": _muinmos_callback_event,
+    "get_muinmos_token": lambda n, url: {"action": "get_muinmos_token", "payload": {
+        "grant_type": "password", "client_id": "bench", "client_secret": "bench",
+        "username": "bench", "password": "bench", "api_url": f"{url}/connect/token"}},
+    "get_muinmos_assessment_result": lambda n, url: {"action": "get_muinmos_assessment_result", "payload": {
+        **_muinmos_auth(url), "assessment_id": f"assessment-{n}"}},
+    "get_muinmos_question": lambda n, url: {"action": "get_muinmos_question", "payload": {
+        "base_api_url": url, "assessment_id": f"assessment-{n}"}},
+    "muinmos_assessment_search": lambda n, url: {"action": "muinmos_assessment_search", "payload": {
+        **_muinmos_auth(url), "from_date": "2024-01-01T00:00:00Z", "to_date": "2024-01-02T00:00:00Z", "page_size": 100}},
+    "send_muinmos_assessment_kycpdf": lambda n, url: {"action": "send_muinmos_assessment_kycpdf", "payload": {
+        **_muinmos_auth(url), "assessment_list": [
+            {"order_assessment_id": f"{n}-{k}", "email": "to@example.com", "assessment_id": f"assessment-{n}-{k}"} for k in range(3)]}},
+    "send_email": lambda n, url: {"action": "send_email", "payload": {
+        "to_email": "to@example.com", "subject": f"Benchmark {n}", "body": "Benchmark body"}},
+    "submit_contact_us": lambda n, url: {"routeKey": "POST /submitContactUs", "body": json.dumps({
+        "to_email": "to@example.com", "subject": f"Contact {n}", "body": "Hello", "recaptcha_token": "benchmark"})},
+}
+
+
+def _is_error(response: Any) -> bool:
+    if not isinstance(response, dict):
+        return True
+    status = response.get("statusCode")
+    if isinstance(status, int):
+        return status >= 400
+    return response.get("success") is False
+
+
+def run_child(spec: Dict[str, Any]) -> Dict[str, Any]:
+    """Replay spec["sequence"] through handler() in this interpreter"""
+    import logging
+    import resource
+
+    logging.basicConfig(level=logging.WARNING)
+    sys.path.insert(0, REPO_ROOT)
+    import lambda_function
+    import main
+    from fake_upstreams import install_stub_aws_clients
+
+    install_stub_aws_clients(main, spec["aws_latency_ms"])
+    url = spec["upstream_url"]
+
+    for n, name in enumerate(spec["warmup"]):
+        lambda_function.handler(EVENTS[name](-n - 1, url), None)
+
+    samples: Dict[str, List[float]] = {}
+    errors: Dict[str, int] = {}
+    started = time.perf_counter()
+    for n, name in enumerate(spec["sequence"]):
+        event = EVENTS[name](n, url)
+        start = time.perf_counter()
+        try:
+            failed = _is_error(lambda_function.handler(event, None))
+        except Exception:
+            failed = True
+        samples.setdefault(name, []).append((time.perf_counter() - start) * 1000)
+        errors[name] = errors.get(name, 0) + int(failed)
+    wall_seconds = time.perf_counter() - started
+
+    return {
+        "samples": samples,
+        "errors": errors,
+        "wall_seconds": wall_seconds,
+        # ru_maxrss is reported in KiB on Linux
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def _spawn(spec: Dict[str, Any], env_overrides: Dict[str, str]) -> Dict[str, Any]:
+    env = dict(os.environ)
+    env.update(BASE_ENV)
+    env.update(spec["env"])
+    env.update(env_overrides)
+    env["PYTHONPATH"] = REPO_ROOT + os.pathsep + env.get("PYTHONPATH", "")
+    proc = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child"],
+        input=json.dumps(spec),
+        capture_output=True,
+        text=True,
+        cwd=REPO_ROOT,
+        env=env,
+        timeout=3600,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"benchmark child failed:\n{proc.stderr}")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def _percentile(values: List[float], q: int) -> float:
+    if len(values) < 2:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[q - 1]
+
+
+def summarize(name: str, samples: List[float], errors: int, peak_rss_mb: float) -> Dict[str, Any]:
+    return {
+        "action": name,
+        "requests": len(samples),
+        "errors": errors,
+        "rps": len(samples) / (sum(samples) / 1000) if sum(samples) else 0.0,
+        "p50_ms": _percentile(samples, 50),
+        "p95_ms": _percentile(samples, 95),
+        "p99_ms": _percentile(samples, 99),
+        "peak_rss_mb": peak_rss_mb,
+    }
+
+
+def run(actions: List[str], weights: Dict[str, float], requests: int, warmup: int, mixed: bool, seed: int, upstream_url: str, aws_latency_ms: float, env_overrides: Dict[str, str]) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    with tempfile.TemporaryDirectory(prefix="lambda-bench-") as workdir:
+        return _run_in(workdir, actions, weights, requests, warmup, mixed, seed, upstream_url, aws_latency_ms, env_overrides)
+
+
+def _run_in(workdir: str, actions: List[str], weights: Dict[str, float], requests: int, warmup: int, mixed: bool, seed: int, upstream_url: str, aws_latency_ms: float, env_overrides: Dict[str, str]) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    # Keep the local stores for outboxes and caches out of the real /tmp defaults
+    env = {
+        "WEBHOOK_OUTBOX_PATH": os.path.join(workdir, "webhook_outbox.sqlite3"),
+        "EMAIL_OUTBOX_PATH": os.path.join(workdir, "email_outbox.sqlite3"),
+        "MUINMOS_SYNC_STORE_DIR": os.path.join(workdir, "muinmos_sync"),
+        "RECAPTCHA_VERIFY_URL": f"{upstream_url}/recaptcha/api/siteverify",
+        "STRIPE_API_BASE": upstream_url,
+    }
+    base_spec = {"upstream_url": upstream_url, "aws_latency_ms": aws_latency_ms, "env": env}
+
+    if mixed:
+        rng = random.Random(seed)
+        sequence = rng.choices(actions, weights=[weights.get(name, 1) for name in actions], k=requests)
+        result = _spawn({**base_spec, "warmup": actions * warmup, "sequence": sequence}, env_overrides)
+        report = [summarize(name, result["samples"][name], result["errors"].get(name, 0), result["peak_rss_mb"]) for name in actions if name in result["samples"]]
+        overall = {"requests": requests, "rps": requests / result["wall_seconds"], "peak_rss_mb": result["peak_rss_mb"]}
+        return report, overall
+
+    report = []
+    for name in actions:
+        result = _spawn({**base_spec, "warmup": [name] * warmup, "sequence": [name] * requests}, env_overrides)
+        report.append(summarize(name, result["samples"][name], result["errors"].get(name, 0), result["peak_rss_mb"]))
+    return report, {}
+
+
+def main() -> int:
+    if "--child" in sys.argv[1:]:
+        print(json.dumps(run_child(json.loads(sys.stdin.read()))))
+        return 0
+
+    from fake_upstreams import FakeUpstreamServer
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--actions", help=f"comma-separated subset of: {', '.join(EVENTS)}")
+    parser.add_argument("--requests", type=int, default=100, help="measured requests per action (or in total with --mixed)")
+    parser.add_argument("--warmup", type=int, default=3, help="unmeasured requests per action before measuring")
+    parser.add_argument("--mixed", action="store_true", help="replay one weighted mix in a single interpreter")
+    parser.add_argument("--weights", help="JSON object overriding the mix weights, e.g. '{\"send_email\": 50}'")
+    parser.add_argument("--seed", type=int, default=1, help="random seed for the --mixed sequence")
+    parser.add_argument("--latency-ms", type=float, default=20, help="fake Stripe/Muinmos/reCAPTCHA latency")
+    parser.add_argument("--pdf-kb", type=int, default=512, help="size of each fake KYC PDF")
+    parser.add_argument("--pdf-latency-ms", type=float, default=300, help="fake KYC PDF latency")
+    parser.add_argument("--aws-latency-ms", type=float, default=15, help="stubbed SES/Lambda call latency")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE", help="extra environment for the handler, repeatable")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    actions = [name.strip() for name in args.actions.split(",")] if args.actions else list(EVENTS)
+    unknown = [name for name in actions if name not in EVENTS]
+    if unknown:
+        parser.error(f"unknown actions: {', '.join(unknown)}")
+    weights = {**DEFAULT_WEIGHTS, **(json.loads(args.weights) if args.weights else {})}
+    env_overrides = dict(item.split("=", 1) for item in args.env)
+
+    with FakeUpstreamServer(latency_ms=args.latency_ms, pdf_kb=args.pdf_kb, pdf_latency_ms=args.pdf_latency_ms) as server:
+        report, overall = run(actions, weights, max(1, args.requests), max(0, args.warmup), args.mixed, args.seed, server.url, args.aws_latency_ms, env_overrides)
+
+    if args.json:
+        print(json.dumps({"actions": report, "overall": overall}, indent=2))
+        return 0
+
+    print(f"{'action':<32} {'requests':>8} {'errors':>6} {'rps':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'peak RSS MB':>12}")
+    for row in report:
+        print(f"{row['action']:<32} {row['requests']:>8} {row['errors']:>6} {row['rps']:>8.1f} {row['p50_ms']:>8.1f} {row['p95_ms']:>8.1f} {row['p99_ms']:>8.1f} {row['peak_rss_mb']:>12.1f}")
+    if overall:
+        print(f"{'mixed total':<32} {overall['requests']:>8} {'':>6} {overall['rps']:>8.1f} {'':>8} {'':>8} {'':>8} {overall['peak_rss_mb']:>12.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,166 +1,451 @@
 from __future__ import annotations
 import json
-from typing import Any, Dict
-from main import create_checkout_session, stripe_webhook, send_email, send_email_smtp, get_muinmos_token, create_assessment, muinmos_assessment_search, get_muinmos_assessment_result, send_muinmos_assessment_kycpdf, send_muinmos_assessment_kycpdf_single_user, muinmos_callback_from_outsystem, muinmos_callback_directly, get_muinmos_question, submit_muinmos_answer, submit_contact_us
+import os
+import re
+import time
+from typing import Any, Callable, Dict, Iterator, NamedTuple, Tuple
+from main import create_checkout_session, create_checkout_sessions, stripe_webhook, send_email_smtp, send_emails_smtp, get_muinmos_token, create_assessment, muinmos_assessment_search, get_muinmos_assessment_result, send_muinmos_assessment_kycpdf, send_muinmos_assessment_kycpdf_single_user, muinmos_callback_from_outsystem, muinmos_callback_directly, get_muinmos_question, submit_muinmos_answer, submit_contact_us, get_cached_muinmos_token, resolve_muinmos_auth, muinmos_token_cached, muinmos_assessment_sync, get_muinmos_assessment_results, drain_webhook_outbox, deliver_email, drain_email_outbox, get_email_outbox_status, metrics, Deadline, set_request_deadline, _parse_event_body
 
 # Test auto deploy #1
 
+_MUINMOS_TOKEN_FIELDS = ("token_type", "access_token")
+
+
+class _ActionSpec(NamedTuple):
+    handler: Callable[[Dict[str, Any], Any], Dict[str, Any]]
+    required: Tuple[str, ...]
+    # Takes token_type/access_token; callers may send muinmos_credentials
+    # instead and the token is fetched from (or cached in) this container.
+    muinmos_auth: bool
+
+
+# Built once at import: action name -> handler and required payload keys
+_ACTIONS: Dict[str, _ActionSpec] = {}
+
+# Built once at import: normalized route name -> event handler
+_ROUTES: Dict[str, Callable[[Dict[str, Any], Any], Dict[str, Any]]] = {}
+
+_ROUTE_KEYS = ("route", "routeKey", "resource", "path", "rawPath")
+
+# HTTP API catch-all route; it fronted the checkout integration before routes were named
+_DEFAULT_ROUTE_KEY = "$default"
+
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "50"))
+BATCH_MAX_WORKERS = int(os.getenv("BATCH_MAX_WORKERS", "8"))
+
+
+def _action(name: str, required: Tuple[str, ...] = (), muinmos_auth: bool = False) -> Callable:
+    def register(fn: Callable[[Dict[str, Any], Any], Dict[str, Any]]) -> Callable:
+        _ACTIONS[name] = _ActionSpec(fn, required + (_MUINMOS_TOKEN_FIELDS if muinmos_auth else ()), muinmos_auth)
+        return fn
+    return register
+
+
+def _route(*names: str) -> Callable:
+    def register(fn: Callable[[Dict[str, Any], Any], Dict[str, Any]]) -> Callable:
+        for name in names:
+            _ROUTES[_normalize_route(name)] = fn
+        return fn
+    return register
+
+
+def _normalize_route(route_key: Any) -> str:
+    return re.sub(r"[^a-z0-9]", "", str(route_key).lower())
+
+
+def _route_candidates(route_key: Any) -> Iterator[str]:
+    # "POST /prod/stripe/webhook/" -> "webhook", "stripewebhook", "prodstripewebhook"
+    # Template segments such as "{proxy+}" are skipped: "/api/sendEmail/{proxy+}" -> "sendemail", ...
+    parts = str(route_key).strip().split()
+    segments = [
+        segment for segment in (parts[-1] if parts else "").split("/")
+        if segment and not (segment.startswith("{") and segment.endswith("}"))
+    ]
+    for start in range(len(segments) - 1, -1, -1):
+        yield _normalize_route("".join(segments[start:]))
+    # Then runs that stop before trailing segments, as the old substring match
+    # allowed: "/api/sendEmail/v1" -> ..., "sendemail"
+    for end in range(len(segments) - 1, 0, -1):
+        for start in range(end - 1, -1, -1):
+            yield _normalize_route("".join(segments[start:end]))
+
+
 def _event_with_body(payload: Dict[str, Any]) -> Dict[str, Any]:
     return {"body": json.dumps(payload)}
 
+
+def _json_response(status_code: int, body: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "statusCode": status_code,
+        "headers": {"Content-Type": "application/json"},
+        "body": json.dumps(body),
+    }
+
+
+@_action("send_muinmos_assessment_kycpdf", required=("base_api_url", "assessment_list"), muinmos_auth=True)
+def _send_muinmos_assessment_kycpdf(payload: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    return send_muinmos_assessment_kycpdf(
+        base_api_url=payload["base_api_url"],
+        token_type=payload["token_type"],
+        access_token=payload["access_token"],
+        assessment_list=payload["assessment_list"],
+        max_workers=payload.get("max_workers")
+    )
+
+
+@_action("send_muinmos_assessment_kycpdf_single_user", required=("base_api_url", "email", "assessment_id"), muinmos_auth=True)
+def _send_muinmos_assessment_kycpdf_single_user(payload: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    return send_muinmos_assessment_kycpdf_single_user(
+        base_api_url=payload["base_api_url"],
+        token_type=payload["token_type"],
+        access_token=payload["access_token"],
+        email=payload["email"],
+        assessment_id=payload["assessment_id"]
+    )
+
+
+@_action("muinmos_assessment_search", required=("from_date", "to_date", "base_api_url"), muinmos_auth=True)
+def _muinmos_assessment_search(payload: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    return muinmos_assessment_search(
+        from_date=payload["from_date"],
+        to_date=payload["to_date"],
+        base_api_url=payload["base_api_url"],
+        token_type=payload["token_type"],
+        access_token=payload["access_token"],
+        page_size=payload.get("page_size"),
+        page_number=payload.get("page_number") or 1,
+        max_pages=payload.get("max_pages"),
+        fields=payload.get("fields"),
+        max_workers=payload.get("max_workers") or 1
+    )
+
+
+@_action("muinmos_assessment_sync", required=("base_api_url",), muinmos_auth=True)
+def _muinmos_assessment_sync(payload: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    return muinmos_assessment_sync(
+        base_api_url=payload["base_api_url"],
+        token_type=payload["token_type"],
+        access_token=payload["access_token"],
+        sync_key=payload.get("sync_key") or "default",
+        from_date=payload.get("from_date"),
+        to_date=payload.get("to_date"),
+        fields=payload.get("fields"),
+        id_field=payload.get("id_field") or "id",
+        max_workers=payload.get("max_workers") or 1
+    )
+
+
+@_action("get_muinmos_assessment_result", required=("base_api_url", "assessment_id"), muinmos_auth=True)
+def _get_muinmos_assessment_result(payload: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    return get_muinmos_assessment_result(
+        base_api_url=payload["base_api_url"],
+        token_type=payload["token_type"],
+        access_token=payload["access_token"],
+        assessment_id=payload["assessment_id"]
+    )
+
+
+@_action("get_muinmos_assessment_results", required=("base_api_url", "assessment_ids"), muinmos_auth=True)
+def _get_muinmos_assessment_results(payload: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    return get_muinmos_assessment_results(
+        base_api_url=payload["base_api_url"],
+        token_type=payload["token_type"],
+        access_token=payload["access_token"],
+        assessment_ids=payload["assessment_ids"],
+        max_workers=payload.get("max_workers")
+    )
+
+
+@_action("get_muinmos_question", required=("base_api_url", "assessment_id"))
+def _get_muinmos_question(payload: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    return get_muinmos_question(
+        base_api_url=payload["base_api_url"],
+        assessment_id=payload["assessment_id"]
+    )
+
+
+@_action("submit_muinmos_answer", required=("base_api_url", "assessment_id", "answer"), muinmos_auth=True)
+def _submit_muinmos_answer(payload: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    return submit_muinmos_answer(
+        base_api_url=payload["base_api_url"],
+        token_type=payload["token_type"],
+        access_token=payload["access_token"],
+        assessment_id=payload["assessment_id"],
+        answer=payload["answer"]
+    )
+
+
+@_action("create_assessment", required=("user_email", "kyc_profile_id", "order_code", "api_url"), muinmos_auth=True)
+def _create_assessment(payload: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    return create_assessment(
+        user_email=payload["user_email"],
+        kyc_profile_id=payload["kyc_profile_id"],
+        order_code=payload["order_code"],
+        api_url=payload["api_url"],
+        token_type=payload["token_type"],
+        access_token=payload["access_token"]
+    )
+
+
+@_action("get_muinmos_token", required=("grant_type", "client_id", "client_secret", "username", "password", "api_url"))
+def _get_muinmos_token(payload: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    token_fn = get_cached_muinmos_token if payload.get("use_cache") else get_muinmos_token
+    return token_fn(
+        grant_type=payload["grant_type"],
+        client_id=payload["client_id"],
+        client_secret=payload["client_secret"],
+        username=payload["username"],
+        password=payload["password"],
+        api_url=payload["api_url"]
+    )
+
+
+@_action("send_email", required=("to_email", "subject", "body"))
+def _send_email(payload: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    return deliver_email(
+        to_email=payload["to_email"],
+        subject=payload["subject"],
+        body=payload["body"],
+        is_html=payload.get("is_html", False),
+        attachment=payload.get("attachment")
+    )
+
+
+@_action("send_email_smtp", required=("to_email", "subject", "body"))
+def _send_email_smtp(payload: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    return send_email_smtp(
+        to_email=payload["to_email"],
+        subject=payload["subject"],
+        body=payload["body"],
+        is_html=payload.get("is_html", False),
+        attachment=payload.get("attachment")
+    )
+
+
+@_action("send_email_smtp_bulk", required=("messages",))
+def _send_email_smtp_bulk(payload: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    return send_emails_smtp(payload["messages"])
+
+
+@_action("create_checkout_session")
+def _create_checkout_session(payload: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    return create_checkout_session(_event_with_body(payload))
+
+
+@_action("create_checkout_sessions", required=("sessions",))
+def _create_checkout_sessions(payload: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    return create_checkout_sessions(payload["sessions"], max_workers=payload.get("max_workers"))
+
+
+@_action("stripe_webhook")
+def _stripe_webhook(payload: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    return stripe_webhook(_event_with_body(payload))
+
+
+@_action("drain_webhook_outbox")
+def _drain_webhook_outbox(payload: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    return drain_webhook_outbox(batch_size=payload.get("batch_size"))
+
+
+@_action("drain_email_outbox")
+def _drain_email_outbox(payload: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    return drain_email_outbox(batch_size=payload.get("batch_size"), max_workers=payload.get("max_workers"))
+
+
+@_action("get_email_outbox_status", required=("outbox_ids",))
+def _get_email_outbox_status(payload: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    return get_email_outbox_status(payload["outbox_ids"])
+
+
+@_route("stripewebhook")
+def _stripe_webhook_route(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    return stripe_webhook(event)
+
+
+@_route("muinmoscallbackfromoutsystem")
+def _muinmos_callback_from_outsystem_route(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    return muinmos_callback_from_outsystem(event)
+
+
+@_route("muinmoscallbackdirectly")
+def _muinmos_callback_directly_route(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    return muinmos_callback_directly(event)
+
+
+def _email_status_code(result: Dict[str, Any]) -> int:
+    # Queued emails (EMAIL_DELIVERY_MODE=outbox) are accepted, not yet sent
+    if not result.get("success"):
+        return 400
+    return 202 if result.get("queued") else 200
+
+
+@_route("submitcontactus")
+def _submit_contact_us_route(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    payload = _parse_event_body(event)
+    result = submit_contact_us(
+        to_email=payload.get("to_email"),
+        subject=payload.get("subject"),
+        body=payload.get("body"),
+        is_html=payload.get("is_html", False),
+        attachment=payload.get("attachment"),
+        recaptcha_token=payload.get("recaptcha_token")
+    )
+    return _json_response(_email_status_code(result), result)
+
+
+@_route("sendemail")
+def _send_email_route(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    payload = _parse_event_body(event)
+    result = deliver_email(
+        to_email=payload.get("to_email"),
+        subject=payload.get("subject"),
+        body=payload.get("body"),
+        is_html=payload.get("is_html", False),
+        attachment=payload.get("attachment")
+    )
+    return _json_response(_email_status_code(result), result)
+
+
+@_route("sendemailsmtp")
+def _send_email_smtp_route(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    payload = _parse_event_body(event)
+    result = send_email_smtp(
+        to_email=payload.get("to_email"),
+        subject=payload.get("subject"),
+        body=payload.get("body"),
+        is_html=payload.get("is_html", False),
+        attachment=payload.get("attachment")
+    )
+    return _json_response(200 if result.get("success") else 400, result)
+
+
+@_route("createcheckoutsession", "createcheckout", "checkoutsession", "checkout")
+def _create_checkout_session_route(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    return create_checkout_session(event)
+
+
+def _dispatch_action(action: Any, payload: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    spec = _ACTIONS.get(action)
+    if spec is None:
+        return _json_response(400, {"error": f"Unknown action: {action}"})
+
+    if spec.muinmos_auth and not payload.get("access_token") and payload.get("muinmos_credentials"):
+        auth = resolve_muinmos_auth(payload["muinmos_credentials"])
+        if not auth.get("success"):
+            return auth
+        result = _run_action(spec, {**payload, "token_type": auth["token_type"], "access_token": auth["access_token"]}, context)
+        # MuinmosClient drops a cached token once Muinmos answers 401; retry once with a fresh one
+        if auth.get("cached") and not muinmos_token_cached(auth["access_token"]):
+            auth = resolve_muinmos_auth(payload["muinmos_credentials"])
+            if not auth.get("success"):
+                return auth
+            result = _run_action(spec, {**payload, "token_type": auth["token_type"], "access_token": auth["access_token"]}, context)
+        return result
+
+    return _run_action(spec, payload, context)
+
+
+def _run_action(spec: _ActionSpec, payload: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    missing = [key for key in spec.required if key not in payload]
+    if missing:
+        return _json_response(400, {"error": f"Missing required parameters: {', '.join(missing)}"})
+
+    return spec.handler(payload, context)
+
+
+def _dispatch_batch(items: Any, max_workers: Any, context: Any) -> Dict[str, Any]:
+    # {"batch": [{"action": ..., "payload": ...}, ...]}: items run concurrently
+    # over the shared clients and results come back in input order. Send
+    # max_workers=1 when later items depend on the side effects of earlier ones.
+    if not isinstance(items, list) or not items:
+        return _json_response(400, {"error": "batch must be a non-empty list"})
+    if len(items) > BATCH_MAX_ITEMS:
+        return _json_response(400, {"error": f"batch holds {len(items)} items; the limit is {BATCH_MAX_ITEMS}"})
+
+    def run_item(item: Any) -> Dict[str, Any]:
+        if not isinstance(item, dict) or "action" not in item:
+            return _json_response(400, {"error": "Each batch item needs an action"})
+        action = item.get("action")
+        # Each item is timed, and its upstream spans tagged, under its own action name
+        with metrics.action(action if action in _ACTIONS else "unknown_action") as record:
+            try:
+                response = _dispatch_action(action, item.get("payload") or {}, context)
+            except Exception as e:
+                response = _json_response(500, {"error": str(e)})
+            record["status"] = _response_status(response)
+        return response
+
+    from concurrent.futures import ThreadPoolExecutor
+
+    workers = max(1, min(int(max_workers or BATCH_MAX_WORKERS), len(items)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(run_item, items))
+    return {
+        "success": True,
+        "results": [
+            {"action": item.get("action") if isinstance(item, dict) else None, "result": result}
+            for item, result in zip(items, results)
+        ]
+    }
+
+
+def _resolve_route(event: Dict[str, Any]) -> Tuple[str, Callable[[Dict[str, Any], Any], Dict[str, Any]]]:
+    route_keys = [event.get(key) for key in _ROUTE_KEYS if event.get(key)]
+    for route_key in route_keys:
+        for candidate in _route_candidates(route_key):
+            route_handler = _ROUTES.get(candidate)
+            if route_handler is not None:
+                return candidate, route_handler
+
+    # "$default", "/" and "/{proxy+}" carry no route name of their own
+    named_keys = [
+        route_key for route_key in route_keys
+        if str(route_key).strip() != _DEFAULT_ROUTE_KEY and next(_route_candidates(route_key), None) is not None
+    ]
+    if named_keys and event.get("routeKey") != _DEFAULT_ROUTE_KEY:
+        return "unknown_route", lambda event, context: _json_response(404, {"error": f"Unknown route: {named_keys[0]}"})
+
+    # Direct invocations, the $default catch-all and bare paths create a checkout session
+    return "createcheckoutsession", _create_checkout_session_route
+
+
+def _dispatch_route(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    return _resolve_route(event)[1](event, context)
+
+
+def _response_status(response: Any) -> Any:
+    if not isinstance(response, dict):
+        return None
+    if "statusCode" in response:
+        return response["statusCode"]
+    return "ok" if response.get("success", True) else "error"
+
+
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
-    if isinstance(event, dict) and "action" in event:
+    if isinstance(event, dict) and "batch" in event:
+        name = "batch"
+        run = lambda: _dispatch_batch(event.get("batch"), event.get("max_workers"), context)
+    elif isinstance(event, dict) and "action" in event:
         action = event.get("action")
-        payload = event.get("payload") or {}
-
-        if action == "send_muinmos_assessment_kycpdf":
-            return send_muinmos_assessment_kycpdf(
-                base_api_url=payload["base_api_url"],
-                token_type=payload["token_type"],
-                access_token=payload["access_token"],
-                assessment_list=payload["assessment_list"]
-            )
-        if action == "send_muinmos_assessment_kycpdf_single_user":
-            return send_muinmos_assessment_kycpdf_single_user(
-                base_api_url=payload["base_api_url"],
-                token_type=payload["token_type"],
-                access_token=payload["access_token"],
-                email=payload["email"],
-                assessment_id=payload["assessment_id"]
-            )
-        if action == "muinmos_assessment_search":
-            return muinmos_assessment_search(
-                from_date=payload["from_date"],
-                to_date=payload["to_date"],
-                base_api_url=payload["base_api_url"],
-                token_type=payload["token_type"],
-                access_token=payload["access_token"]
-            )
-        if action == "get_muinmos_assessment_result":
-            return get_muinmos_assessment_result(
-                base_api_url=payload["base_api_url"],
-                token_type=payload["token_type"],
-                access_token=payload["access_token"],
-                assessment_id=payload["assessment_id"]
-            )
-        if action == "get_muinmos_question":
-            return get_muinmos_question(
-                base_api_url=payload["base_api_url"],
-                assessment_id=payload["assessment_id"]
-            )
-        if action == "submit_muinmos_answer":
-            return submit_muinmos_answer(
-                base_api_url=payload["base_api_url"],
-                token_type=payload["token_type"],
-                access_token=payload["access_token"],
-                assessment_id=payload["assessment_id"],
-                answer=payload["answer"]
-            )
-        if action == "create_assessment":
-            return create_assessment(
-                user_email=payload["user_email"],
-                kyc_profile_id=payload["kyc_profile_id"],
-                order_code=payload["order_code"],
-                api_url=payload["api_url"],
-                token_type=payload["token_type"],
-                access_token=payload["access_token"]
-            )
-        if action == "get_muinmos_token":
-            return get_muinmos_token(
-                grant_type=payload["grant_type"],
-                client_id=payload["client_id"],
-                client_secret=payload["client_secret"],
-                username=payload["username"],
-                password=payload["password"],
-                api_url=payload["api_url"]
-            )
-        if action == "send_email":
-            return send_email(
-                to_email=payload["to_email"],
-                subject=payload["subject"],
-                body=payload["body"],
-                is_html=payload.get("is_html", False),
-                attachment=payload.get("attachment")
-            )
-        if action == "send_email_smtp":
-            return send_email_smtp(
-                to_email=payload["to_email"],
-                subject=payload["subject"],
-                body=payload["body"],
-                is_html=payload.get("is_html", False),
-                attachment=payload.get("attachment")
-            )
-        if action == "create_checkout_session":
-            return create_checkout_session(_event_with_body(payload))
-        if action == "stripe_webhook":
-            return stripe_webhook(_event_with_body(payload))
-
-        return {
-            "statusCode": 400,
-            "headers": {"Content-Type": "application/json"},
-            "body": json.dumps({"error": f"Unknown action: {action}"}),
-        }
-
-    route_key = None
-    if isinstance(event, dict):
-        route_key = event.get("route") or event.get("routeKey") or event.get("resource") or event.get("path")
-
-    if route_key and "stripewebhook" in str(route_key).lower():
-        return stripe_webhook(event)
-    
-    if route_key and "muinmoscallbackfromoutsystem" in str(route_key).lower():
-        return muinmos_callback_from_outsystem(event)
-
-    if route_key and "muinmoscallbackdirectly" in str(route_key).lower():
-        return muinmos_callback_directly(event)
-            
-    if route_key and "submitcontactus" in str(route_key).lower():
-        from main import _parse_event_body
-        payload = _parse_event_body(event)
-        result = submit_contact_us(
-            to_email=payload.get("to_email"),
-            subject=payload.get("subject"),
-            body=payload.get("body"),
-            is_html=payload.get("is_html", False),
-            attachment=payload.get("attachment"),
-            recaptcha_token=payload.get("recaptcha_token")
-        )
-        return {
-            "statusCode": 200 if result.get("success") else 400,
-            "headers": {"Content-Type": "application/json"},
-            "body": json.dumps(result)
-        }
-
-    if route_key and "sendemail" in str(route_key).lower():
-        from main import _parse_event_body
-        payload = _parse_event_body(event)
-        result = send_email(
-            to_email=payload.get("to_email"),
-            subject=payload.get("subject"),
-            body=payload.get("body"),
-            is_html=payload.get("is_html", False),
-            attachment=payload.get("attachment")
-        )
-        return {
-            "statusCode": 200 if result.get("success") else 400,
-            "headers": {"Content-Type": "application/json"},
-            "body": json.dumps(result)
-        }
-    
-    if route_key and "sendemailsmtp" in str(route_key).lower():
-        from main import _parse_event_body
-        payload = _parse_event_body(event)
-        result = send_email_smtp(
-            to_email=payload.get("to_email"),
-            subject=payload.get("subject"),
-            body=payload.get("body"),
-            is_html=payload.get("is_html", False),
-            attachment=payload.get("attachment")
-        )
-        return {
-            "statusCode": 200 if result.get("success") else 400,
-            "headers": {"Content-Type": "application/json"},
-            "body": json.dumps(result)
-        }
+        name = action if action in _ACTIONS else "unknown_action"
+        run = lambda: _dispatch_action(action, event.get("payload") or {}, context)
+    else:
+        if not isinstance(event, dict):
+            event = {}
+        name, route_handler = _resolve_route(event)
+        run = lambda: route_handler(event, context)
 
-    return create_checkout_session(event)
+    # Upstream spans recorded while handling this event are emitted as one
+    # batch of CloudWatch EMF records, tagged with the action or route name.
+    # Every outbound call caps its timeout to the deadline set here.
+    metrics.reset()
+    set_request_deadline(Deadline.from_context(context))
+    start = time.perf_counter()
+    status: Any = "exception"
+    try:
+        response = run()
+        status = _response_status(response)
+        return response
+    finally:
+        set_request_deadline(Deadline())
+        metrics.flush(name, (time.perf_counter() - start) * 1000, status)
@@ -1,38 +1,739 @@
 from __future__ import annotations
+import contextlib
+import functools
+import http.client
+import importlib
 import json
 import os
 import logging
+import queue
+import re
+import sys
+import time
 import urllib.parse
 import urllib.request
-from typing import Any, Dict
-import boto3
-import stripe
+import threading
+import uuid
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Iterator, Optional, Tuple
 
 STRIPE_API_KEY = os.getenv("STRIPE_API_KEY", "")
 STRIPE_WEBHOOK_SECRET = os.getenv("STRIPE_WEBHOOK_SECRET", "")
 WEBHOOK_TARGET_LAMBDA_ARN = os.getenv("WEBHOOK_TARGET_LAMBDA_ARN", "")
+# "sync" waits for the target Lambda, "event" invokes it asynchronously and
+# "outbox" persists the event for drain_webhook_outbox to deliver.
+WEBHOOK_FORWARD_MODE = os.getenv("WEBHOOK_FORWARD_MODE", "sync").lower()
+# Required for "outbox" mode and must be shared storage (e.g. an EFS mount):
+# rows left in a container's own /tmp are lost when the container goes away.
+WEBHOOK_OUTBOX_PATH = os.getenv("WEBHOOK_OUTBOX_PATH", "")
+WEBHOOK_OUTBOX_BATCH_SIZE = int(os.getenv("WEBHOOK_OUTBOX_BATCH_SIZE", "25"))
+# Pending rows each webhook invocation delivers after queueing its own event; 0 disables
+WEBHOOK_OUTBOX_DRAIN_ON_RECEIVE = int(os.getenv("WEBHOOK_OUTBOX_DRAIN_ON_RECEIVE", "5"))
+WEBHOOK_OUTBOX_MAX_ATTEMPTS = int(os.getenv("WEBHOOK_OUTBOX_MAX_ATTEMPTS", "10"))
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+IDEMPOTENCY_MAX_KEYS = int(os.getenv("IDEMPOTENCY_MAX_KEYS", "10000"))
+IDEMPOTENCY_STORE_DIR = os.getenv("IDEMPOTENCY_STORE_DIR", "")
+# How often a container deletes expired records from IDEMPOTENCY_STORE_DIR
+IDEMPOTENCY_SWEEP_SECONDS = int(os.getenv("IDEMPOTENCY_SWEEP_SECONDS", "3600"))
+STRIPE_WEBHOOK_RESPONSE_OBJECT = os.getenv("STRIPE_WEBHOOK_RESPONSE_OBJECT", "true").lower() in ("1", "true", "yes")
+STRIPE_API_BASE = os.getenv("STRIPE_API_BASE", "https://api.stripe.com")
+STRIPE_POOL_SIZE = int(os.getenv("STRIPE_POOL_SIZE", "4"))
+STRIPE_CONNECT_TIMEOUT = float(os.getenv("STRIPE_CONNECT_TIMEOUT", "10"))
+STRIPE_READ_TIMEOUT = float(os.getenv("STRIPE_READ_TIMEOUT", "120"))
+STRIPE_CHECKOUT_IDEMPOTENT = os.getenv("STRIPE_CHECKOUT_IDEMPOTENT", "false").lower() in ("1", "true", "yes")
+STRIPE_CHECKOUT_CACHE_SIZE = int(os.getenv("STRIPE_CHECKOUT_CACHE_SIZE", "256"))
 DEFAULT_CURRENCY = os.getenv("STRIPE_DEFAULT_CURRENCY", "usd")
 SES_FROM_EMAIL = os.getenv("SES_FROM_EMAIL", "")
+# "sync" sends through SES inside the request, "outbox" validates and queues
+# the email for drain_email_outbox and answers 202 straight away.
+EMAIL_DELIVERY_MODE = os.getenv("EMAIL_DELIVERY_MODE", "sync").lower()
+# Required for "outbox" mode and must be shared storage (e.g. an EFS mount):
+# rows left in a container's own /tmp are lost when the container goes away.
+EMAIL_OUTBOX_PATH = os.getenv("EMAIL_OUTBOX_PATH", "")
+EMAIL_OUTBOX_BATCH_SIZE = int(os.getenv("EMAIL_OUTBOX_BATCH_SIZE", "50"))
+# Pending rows each enqueue delivers after queueing its own email; 0 disables
+EMAIL_OUTBOX_DRAIN_ON_ENQUEUE = int(os.getenv("EMAIL_OUTBOX_DRAIN_ON_ENQUEUE", "5"))
+EMAIL_OUTBOX_MAX_ATTEMPTS = int(os.getenv("EMAIL_OUTBOX_MAX_ATTEMPTS", "5"))
 APP_AWS_REGION = os.getenv("APP_AWS_REGION", "us-east-1")
 SMTP_GMAIL_USER = os.getenv("SMTP_GMAIL_USER", "")
 SMTP_GMAIL_PASSWORD = os.getenv("SMTP_GMAIL_PASSWORD", "")
 SMTP_GMAIL_HOST = os.getenv("SMTP_GMAIL_HOST", "")
 SMTP_GMAIL_PORT = os.getenv("SMTP_GMAIL_PORT", "587")
+SMTP_POOL_SIZE = int(os.getenv("SMTP_POOL_SIZE", "2"))
+SMTP_TIMEOUT = float(os.getenv("SMTP_TIMEOUT", "30"))
+SMTP_NOOP_AFTER = float(os.getenv("SMTP_NOOP_AFTER", "10"))
 OUTSYSTEM_HEADER_AUTH = os.getenv("OUTSYSTEM_HEADER_AUTH", "")
 MUINMOS_API_KEY = os.getenv("MUINMOS_API_KEY", "")
 RECAPTCHA_SECRET_KEY = os.getenv("RECAPTCHA_SECRET_KEY", "")
+RECAPTCHA_VERIFY_URL = os.getenv("RECAPTCHA_VERIFY_URL", "https://www.google.com/recaptcha/api/siteverify")
+AWS_MAX_POOL_CONNECTIONS = int(os.getenv("AWS_MAX_POOL_CONNECTIONS", "10"))
+AWS_TCP_KEEPALIVE = os.getenv("AWS_TCP_KEEPALIVE", "true").lower() in ("1", "true", "yes")
+MUINMOS_IMPERSONATE = os.getenv("MUINMOS_IMPERSONATE", "chrome110")
+MUINMOS_POOL_SIZE = int(os.getenv("MUINMOS_POOL_SIZE", "4"))
+MUINMOS_TOKEN_REFRESH_MARGIN = int(os.getenv("MUINMOS_TOKEN_REFRESH_MARGIN", "60"))
+MUINMOS_SEARCH_PAGE_SIZE = int(os.getenv("MUINMOS_SEARCH_PAGE_SIZE", "200"))
+# Must be shared storage (e.g. an EFS mount): checkpoints in a container's own
+# /tmp are lost on cold start and not seen by other containers.
+MUINMOS_SYNC_STORE_DIR = os.getenv("MUINMOS_SYNC_STORE_DIR", "")
+MUINMOS_SYNC_SEEN_RETENTION = int(os.getenv("MUINMOS_SYNC_SEEN_RETENTION", "3600"))
+MUINMOS_RESULT_CACHE_MAX_BYTES = int(os.getenv("MUINMOS_RESULT_CACHE_MAX_BYTES", str(8 * 1024 * 1024)))
+MUINMOS_RESULT_CACHE_DIR = os.getenv("MUINMOS_RESULT_CACHE_DIR", "")
+KYCPDF_MAX_WORKERS = int(os.getenv("KYCPDF_MAX_WORKERS", "1"))
+KYCPDF_MIN_REMAINING_MS = int(os.getenv("KYCPDF_MIN_REMAINING_MS", "15000"))
+# Requests per second allowed per upstream; 0 disables the limiter. SES
+# accounts send rate per recipient, and every send here has exactly one.
+SES_MAX_SEND_RATE = float(os.getenv("SES_MAX_SEND_RATE", "14"))
+MUINMOS_MAX_REQUEST_RATE = float(os.getenv("MUINMOS_MAX_REQUEST_RATE", "10"))
+MUINMOS_MAX_RETRIES = int(os.getenv("MUINMOS_MAX_RETRIES", "2"))
+MUINMOS_RETRY_BASE_DELAY = float(os.getenv("MUINMOS_RETRY_BASE_DELAY", "0.2"))
+MUINMOS_RETRY_MAX_DELAY = float(os.getenv("MUINMOS_RETRY_MAX_DELAY", "5"))
+MUINMOS_BREAKER_FAILURES = int(os.getenv("MUINMOS_BREAKER_FAILURES", "5"))
+MUINMOS_BREAKER_RESET_SECONDS = float(os.getenv("MUINMOS_BREAKER_RESET_SECONDS", "30"))
+THROTTLE_MAX_RETRIES = int(os.getenv("THROTTLE_MAX_RETRIES", "5"))
+THROTTLE_MAX_BACKOFF = float(os.getenv("THROTTLE_MAX_BACKOFF", "20"))
+# Reserved at the end of every invocation so partial results can still be returned
+DEADLINE_SAFETY_MARGIN_MS = int(os.getenv("DEADLINE_SAFETY_MARGIN_MS", "3000"))
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+METRICS_NAMESPACE = os.getenv("METRICS_NAMESPACE", "KYCFastAPIFunctionExternal")
 # Note: If this Lambda runs inside a VPC, it needs outbound access to the Lambda
 # API to invoke another function. Use a NAT Gateway or a VPC Interface Endpoint
 # for Lambda (com.amazonaws.<region>.lambda). The target Lambda can be in or out
 # of a VPC; invocation is handled by AWS. Ensure IAM allows lambda:InvokeFunction.
 
-if STRIPE_API_KEY:
-    stripe.api_key = STRIPE_API_KEY
-
 logger = logging.getLogger(__name__)
 if not logger.handlers:
     logging.basicConfig(level=logging.INFO)
 
+# Heavy dependencies (boto3, stripe, curl_cffi, email.mime) are imported on
+# first use by the routes that need them and cached for the container's
+# lifetime, so a Muinmos-only or email-only cold start never loads Stripe.
+@functools.lru_cache(maxsize=None)
+def _lazy_import(module_name: str) -> Any:
+    return importlib.import_module(module_name)
+
+def _stripe() -> Any:
+    stripe = _lazy_import("stripe")
+    if STRIPE_API_KEY and stripe.api_key != STRIPE_API_KEY:
+        stripe.api_key = STRIPE_API_KEY
+    return stripe
+
+class UpstreamMetrics:
+    """Spans around outbound calls, flushed as CloudWatch Embedded Metric Format.
+
+    Spans are collected per invocation from every thread (Lambda runs one
+    invocation per container at a time), aggregated per upstream and
+    operation, and written to stdout as EMF records by flush(), which the
+    handler calls once at the end of each invocation.
+
+    Work run inside action() (one item of a batch) gets its own Action
+    record, and spans started on that thread are tagged with its name
+    instead of the invocation's. Spans from pools the action starts itself
+    fall back to the invocation's name.
+    """
+
+    _MAX_VALUES = 100  # EMF limit on values per metric in one record
+
+    def __init__(self, namespace: str, enabled: bool = True) -> None:
+        self.namespace = namespace
+        self.enabled = enabled
+        self._spans: list = []
+        self._actions: list = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def action(self, name: str) -> Iterator[Dict[str, Any]]:
+        """Time one action within the invocation; the caller fills in status"""
+        record = {"action": name, "status": None}
+        previous = getattr(self._local, "action", None)
+        self._local.action = name
+        start = time.perf_counter()
+        try:
+            yield record
+        except Exception as e:
+            if record["status"] is None:
+                record["status"] = type(e).__name__
+            raise
+        finally:
+            self._local.action = previous
+            record["duration_ms"] = (time.perf_counter() - start) * 1000
+            if self.enabled:
+                with self._lock:
+                    self._actions.append(record)
+
+    @contextlib.contextmanager
+    def span(self, upstream: str, operation: str, bytes_out: int = 0) -> Iterator[Dict[str, Any]]:
+        """Time one outbound call; the caller fills in status and bytes_in"""
+        record = {
+            "upstream": upstream, "operation": operation, "action": getattr(self._local, "action", None),
+            "status": None, "bytes_out": bytes_out, "bytes_in": 0
+        }
+        start = time.perf_counter()
+        try:
+            yield record
+        except Exception as e:
+            if record["status"] is None:
+                record["status"] = type(e).__name__
+            raise
+        finally:
+            record["duration_ms"] = (time.perf_counter() - start) * 1000
+            if record["status"] is None:
+                record["status"] = "ok"
+            if self.enabled:
+                with self._lock:
+                    self._spans.append(record)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._spans = []
+            self._actions = []
+
+    def flush(self, action: str, duration_ms: float, status: Any = None) -> None:
+        with self._lock:
+            spans, self._spans = self._spans, []
+            actions, self._actions = self._actions, []
+        if not self.enabled:
+            return
+
+        groups: Dict[Tuple[str, str, str], list] = {}
+        for record in spans:
+            groups.setdefault((record["action"] or action, record["upstream"], record["operation"]), []).append(record)
+
+        timestamp = int(time.time() * 1000)
+        lines = [self._emf(timestamp, [["Action"]], {"Action": action, "Status": str(status)}, {"Duration": ("Milliseconds", [duration_ms])})]
+        for record in actions:
+            lines.append(self._emf(
+                timestamp, [["Action"]], {"Action": record["action"], "Status": str(record["status"])},
+                {"Duration": ("Milliseconds", [record["duration_ms"]])}
+            ))
+        for (span_action, upstream, operation), records in groups.items():
+            for start in range(0, len(records), self._MAX_VALUES):
+                chunk = records[start:start + self._MAX_VALUES]
+                statuses: Dict[str, int] = {}
+                for record in chunk:
+                    statuses[str(record["status"])] = statuses.get(str(record["status"]), 0) + 1
+                errors = sum(1 for record in chunk if not self._succeeded(record["status"]))
+                lines.append(self._emf(
+                    timestamp,
+                    [["Upstream", "Operation"], ["Upstream", "Action"], ["Upstream"]],
+                    {"Upstream": upstream, "Operation": operation, "Action": span_action, "Statuses": statuses},
+                    {
+                        "UpstreamDuration": ("Milliseconds", [record["duration_ms"] for record in chunk]),
+                        "RequestBytes": ("Bytes", [record["bytes_out"] for record in chunk]),
+                        "ResponseBytes": ("Bytes", [record["bytes_in"] for record in chunk]),
+                        "Calls": ("Count", [len(chunk)]),
+                        "Errors": ("Count", [errors]),
+                    }
+                ))
+        # EMF records must be bare JSON log lines, so they bypass the logging formatter
+        sys.stdout.write("\n".join(lines) + "\n")
+        sys.stdout.flush()
+
+    @staticmethod
+    def _succeeded(status: Any) -> bool:
+        return status == "ok" or (isinstance(status, int) and status < 400)
+
+    def _emf(self, timestamp: int, dimensions: list, properties: Dict[str, Any], metrics: Dict[str, Tuple[str, list]]) -> str:
+        record: Dict[str, Any] = {
+            "_aws": {
+                "Timestamp": timestamp,
+                "CloudWatchMetrics": [{
+                    "Namespace": self.namespace,
+                    "Dimensions": dimensions,
+                    "Metrics": [{"Name": name, "Unit": unit} for name, (unit, _) in metrics.items()],
+                }],
+            },
+        }
+        record.update(properties)
+        for name, (_, values) in metrics.items():
+            record[name] = values[0] if len(values) == 1 else values
+        return json.dumps(record)
+
+
+metrics = UpstreamMetrics(METRICS_NAMESPACE, METRICS_ENABLED)
+
+_ID_SEGMENT = re.compile(r"^(?=.*\d)[0-9A-Za-z-]{8,}$")
+
+
+def _span_operation(method: str, url: str) -> str:
+    # "POST https://host/api/assessment/6f1c.../question?x" -> "POST /api/assessment/{id}/question"
+    path = urllib.parse.urlsplit(url).path
+    return f"{method.upper()} " + "/".join("{id}" if _ID_SEGMENT.match(segment) else segment for segment in path.split("/"))
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised instead of starting an outbound call once the invocation budget is spent"""
+
+
+_NOT_PROCESSED = "Not processed: insufficient remaining invocation time"
+
+
+class Deadline:
+    """Time budget for one invocation, taken from the Lambda context.
+
+    timeout() caps a call's own timeout to what is left of the budget minus
+    the safety margin, so a slow upstream cannot run the function into its
+    hard timeout. A Deadline without an expiry (tests, scripts) never caps.
+    """
+
+    def __init__(self, expires_at: Optional[float] = None) -> None:
+        self.expires_at = expires_at
+
+    @classmethod
+    def from_context(cls, context: Any, margin_ms: int = DEADLINE_SAFETY_MARGIN_MS) -> "Deadline":
+        get_remaining = getattr(context, "get_remaining_time_in_millis", None)
+        if get_remaining is None:
+            return cls()
+        return cls(time.monotonic() + (get_remaining() - margin_ms) / 1000)
+
+    def remaining(self) -> float:
+        if self.expires_at is None:
+            return float("inf")
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def check(self) -> None:
+        if self.expired():
+            raise DeadlineExceeded(_NOT_PROCESSED)
+
+    def timeout(self, default: float) -> float:
+        self.check()
+        return min(default, self.remaining())
+
+
+# Lambda runs one invocation per container at a time, so the handler sets the
+# deadline here and every outbound call (in any worker thread) reads it.
+_request_deadline = Deadline()
+
+
+def set_request_deadline(deadline: Deadline) -> None:
+    global _request_deadline
+    _request_deadline = deadline
+
+
+def request_deadline() -> Deadline:
+    return _request_deadline
+
+
+# AWS clients are created lazily once per (service, region) and kept for the
+# lifetime of the container, so warm invocations reuse the botocore endpoint
+# data and the open HTTPS connections in the client's urllib3 pool.
+_aws_clients: Dict[Tuple[str, Optional[str]], Any] = {}
+_aws_clients_lock = threading.Lock()
+
+def _get_aws_client(service_name: str, region_name: Optional[str] = None) -> Any:
+    key = (service_name, region_name)
+    client = _aws_clients.get(key)
+    if client is not None:
+        return client
+
+    with _aws_clients_lock:
+        client = _aws_clients.get(key)
+        if client is None:
+            boto3 = _lazy_import("boto3")
+            config = _lazy_import("botocore.config").Config(
+                max_pool_connections=AWS_MAX_POOL_CONNECTIONS,
+                tcp_keepalive=AWS_TCP_KEEPALIVE,
+            )
+            client = boto3.client(service_name, region_name=region_name, config=config)
+            _aws_clients[key] = client
+    return client
+
+class TokenBucket:
+    """Thread-safe token bucket shared by every caller of one upstream.
+
+    acquire() blocks until a token is available. When the upstream throttles
+    anyway, defer() holds back all callers until its Retry-After has passed;
+    this applies even when the rate is 0 (no limit).
+    """
+
+    def __init__(self, rate: float, burst: Optional[float] = None) -> None:
+        self.rate = rate
+        self.capacity = max(1.0, burst if burst is not None else rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._not_before = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if self.rate <= 0:
+                    # No rate limit, but a throttle from the upstream is still honoured
+                    if now >= self._not_before:
+                        return
+                    wait = self._not_before - now
+                else:
+                    self._tokens = min(self.capacity, self._tokens + max(0.0, now - self._updated) * self.rate)
+                    self._updated = max(self._updated, now)
+                    if now >= self._not_before and self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+                    wait = max(self._not_before - now, (1 - self._tokens) / self.rate)
+            time.sleep(wait)
+
+    def defer(self, seconds: float) -> None:
+        with self._lock:
+            self._not_before = max(self._not_before, time.monotonic() + seconds)
+            # The bucket starts refilling only once the deferral has passed
+            self._tokens = 0.0
+            self._updated = max(self._updated, self._not_before)
+
+
+rate_limiters: Dict[str, TokenBucket] = {
+    "ses": TokenBucket(SES_MAX_SEND_RATE),
+    "muinmos": TokenBucket(MUINMOS_MAX_REQUEST_RATE),
+}
+
+
+def _throttle_delay(attempt: int, retry_after: Any = None) -> float:
+    """Seconds to wait before retry number attempt (0-based) of a throttled call"""
+    if retry_after is not None:
+        try:
+            return min(THROTTLE_MAX_BACKOFF, max(0.0, float(retry_after)))
+        except (TypeError, ValueError):
+            pass
+    import random
+
+    return random.uniform(0, min(THROTTLE_MAX_BACKOFF, 0.5 * 2 ** attempt))
+
+
+def _retry_delay(attempt: int) -> float:
+    """Full-jitter exponential backoff before retry number attempt (0-based) of a failed call"""
+    import random
+
+    return random.uniform(0, min(MUINMOS_RETRY_MAX_DELAY, MUINMOS_RETRY_BASE_DELAY * 2 ** attempt))
+
+
+class CircuitOpenError(ConnectionError):
+    """Raised instead of calling an endpoint whose circuit breaker is open"""
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker for one upstream endpoint.
+
+    While closed every call goes through. After failure_threshold failures
+    in a row it opens and calls fail fast with CircuitOpenError for
+    reset_seconds; it is then half-open and lets a single probe through,
+    whose outcome closes it again or re-opens it.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, name: str, failure_threshold: int, reset_seconds: float) -> None:
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_seconds = reset_seconds
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def before_call(self) -> None:
+        with self._lock:
+            if self.state == self.OPEN:
+                retry_in = self._opened_at + self.reset_seconds - time.monotonic()
+                if retry_in > 0:
+                    raise CircuitOpenError(f"{self.name} is unavailable; circuit open for another {retry_in:.1f}s")
+                self.state, self._probing = self.HALF_OPEN, False
+            if self.state == self.HALF_OPEN:
+                if self._probing:
+                    raise CircuitOpenError(f"{self.name} is unavailable; waiting for a probe request")
+                self._probing = True
+
+    def record(self, success: Optional[bool]) -> None:
+        """Record a call's outcome; None (e.g. cut short by the deadline) leaves the state alone"""
+        with self._lock:
+            probe = self.state == self.HALF_OPEN
+            self._probing = False
+            if success is None:
+                return
+            if success:
+                self._failures, self.state = 0, self.CLOSED
+                return
+            self._failures += 1
+            if probe or self._failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.warning("circuit: %s opened after %d failures", self.name, self._failures)
+                self.state, self._opened_at = self.OPEN, time.monotonic()
+
+
+_IDEMPOTENT_METHODS = ("GET", "HEAD", "OPTIONS", "PUT", "DELETE")
+_RETRYABLE_STATUS = (500, 502, 503, 504)
+
+
+class MuinmosClient:
+    """Pooled curl_cffi sessions for the Muinmos API, kept across warm invocations.
+
+    Each base URL gets up to ``pool_size`` sessions. A session owns one curl
+    handle, which keeps its connections alive and negotiates HTTP/2 through
+    the browser impersonation profile, so only the first call per session
+    pays the TLS handshake.
+    """
+
+    def __init__(self, pool_size: int = MUINMOS_POOL_SIZE, impersonate: str = MUINMOS_IMPERSONATE) -> None:
+        self.pool_size = max(1, pool_size)
+        self.impersonate = impersonate
+        self._pools: Dict[str, queue.LifoQueue] = {}
+        self._created: Dict[str, int] = {}
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _base_url(url: str) -> str:
+        parts = urllib.parse.urlsplit(url)
+        return f"{parts.scheme}://{parts.netloc}".lower()
+
+    def _acquire(self, base_url: str) -> Any:
+        with self._lock:
+            pool = self._pools.setdefault(base_url, queue.LifoQueue())
+            try:
+                return pool.get_nowait()
+            except queue.Empty:
+                pass
+            create = self._created.get(base_url, 0) < self.pool_size
+            if create:
+                self._created[base_url] = self._created.get(base_url, 0) + 1
+
+        if not create:
+            return pool.get()
+
+        try:
+            return _lazy_import("curl_cffi.requests").Session(impersonate=self.impersonate)
+        except Exception:
+            with self._lock:
+                self._created[base_url] -= 1
+            raise
+
+    def _release(self, base_url: str, session: Any) -> None:
+        self._pools[base_url].put(session)
+
+    @staticmethod
+    def _body_size(kwargs: Dict[str, Any]) -> int:
+        # Encoded the way curl_cffi encodes it: json= wins, dict data is form-encoded
+        if kwargs.get("json") is not None:
+            return len(json.dumps(kwargs["json"], separators=(",", ":")).encode("utf-8"))
+        data = kwargs.get("data")
+        if isinstance(data, (dict, list, tuple)):
+            return len(urllib.parse.urlencode(data))
+        if isinstance(data, str):
+            return len(data.encode("utf-8"))
+        if isinstance(data, (bytes, bytearray)):
+            return len(data)
+        return 0
+
+    def _breaker(self, endpoint: str) -> CircuitBreaker:
+        breaker = self._breakers.get(endpoint)
+        if breaker is None:
+            with self._lock:
+                breaker = self._breakers.setdefault(
+                    endpoint, CircuitBreaker(f"muinmos {endpoint}", MUINMOS_BREAKER_FAILURES, MUINMOS_BREAKER_RESET_SECONDS)
+                )
+        return breaker
+
+    def request(self, method: str, url: str, idempotent: Optional[bool] = None, **kwargs: Any) -> Any:
+        """Send one logical request, retrying throttled and (if idempotent) failed attempts.
+
+        A 429 means the request was not processed, so it is retried for any
+        method. 5xx responses and connection errors are retried with jittered
+        backoff only when idempotent (by default: GET, HEAD, OPTIONS, PUT and
+        DELETE). Each endpoint has a circuit breaker that fails fast with
+        CircuitOpenError while Muinmos keeps failing.
+        """
+        base_url = self._base_url(url)
+        operation = _span_operation(method, url)
+        breaker = self._breaker(f"{base_url} {operation}")
+        limiter = rate_limiters["muinmos"]
+        deadline = request_deadline()
+        timeout = kwargs.pop("timeout", 30)
+        bytes_out = self._body_size(kwargs)
+        if idempotent is None:
+            idempotent = method.upper() in _IDEMPOTENT_METHODS
+        throttled = failed = 0
+        while True:
+            limiter.acquire()
+            session = self._acquire(base_url)
+            # Only take the half-open probe slot once nothing but the call itself can fail
+            try:
+                breaker.before_call()
+            except CircuitOpenError:
+                self._release(base_url, session)
+                raise
+            error: Optional[Exception] = None
+            try:
+                with metrics.span("muinmos", operation, bytes_out) as span:
+                    resp = session.request(method, url, timeout=deadline.timeout(timeout), **kwargs)
+                    span["status"] = resp.status_code
+                    span["bytes_in"] = len(resp.content or b"")
+            except Exception as e:
+                # A timeout cut short by the invocation budget is reported as such
+                if isinstance(e, DeadlineExceeded):
+                    breaker.record(None)
+                    raise
+                if deadline.expired():
+                    breaker.record(None)
+                    raise DeadlineExceeded(_NOT_PROCESSED) from e
+                error = e
+            finally:
+                self._release(base_url, session)
+
+            if error is None and resp.status_code == 401:
+                # The token was revoked or rotated; stop serving it from the token cache
+                authorization = (kwargs.get("headers") or {}).get("Authorization") or ""
+                invalidate_muinmos_token(authorization.split(" ", 1)[-1])
+
+            if error is None and resp.status_code not in _RETRYABLE_STATUS:
+                breaker.record(True)
+                if resp.status_code != 429 or throttled >= THROTTLE_MAX_RETRIES:
+                    return resp
+                delay = _throttle_delay(throttled, resp.headers.get("Retry-After"))
+                if delay >= deadline.remaining():
+                    return resp
+                logger.warning("muinmos: throttled on %s, retrying in %.2fs", operation, delay)
+                limiter.defer(delay)
+                throttled += 1
+                continue
+
+            breaker.record(False)
+            delay = _retry_delay(failed)
+            if not idempotent or failed >= MUINMOS_MAX_RETRIES or delay >= deadline.remaining():
+                if error is not None:
+                    raise error
+                return resp
+            logger.warning("muinmos: %s failed (%s), retrying in %.2fs", operation, error or f"HTTP {resp.status_code}", delay)
+            time.sleep(delay)
+            failed += 1
+
+    def get(self, url: str, **kwargs: Any) -> Any:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs: Any) -> Any:
+        return self.request("POST", url, **kwargs)
+
+    def close(self) -> None:
+        with self._lock:
+            pools, self._pools, self._created = self._pools, {}, {}
+        for pool in pools.values():
+            while True:
+                try:
+                    pool.get_nowait().close()
+                except queue.Empty:
+                    break
+
+muinmos_client = MuinmosClient()
+
+class HttpStatusError(Exception):
+    """Upstream HTTP call returned an error status"""
+
+    def __init__(self, status: int, body: bytes) -> None:
+        super().__init__(f"HTTP {status}")
+        self.status = status
+        self.body = body
+
+
+class HttpConnectionPool:
+    """Keep-alive HTTP(S) connections to a single origin, reused across warm invocations.
+
+    Up to pool_size idle connections are kept. A request that fails on a
+    reused connection because the server closed it while idle is retried
+    once on a fresh connection: always if it could not be written, but after
+    it was written only for idempotent methods or requests carrying an
+    Idempotency-Key, since the server may already have acted on it.
+    """
+
+    _STALE_ERRORS = (http.client.RemoteDisconnected, http.client.CannotSendRequest, ConnectionResetError, BrokenPipeError)
+
+    def __init__(self, base_url: str, pool_size: int, connect_timeout: float, read_timeout: float, upstream: str = "http") -> None:
+        parts = urllib.parse.urlsplit(base_url)
+        self.upstream = upstream
+        self.scheme = parts.scheme
+        self.host = parts.hostname
+        self.port = parts.port
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self._idle: queue.LifoQueue = queue.LifoQueue(maxsize=max(1, pool_size))
+
+    def _new_connection(self) -> http.client.HTTPConnection:
+        connection_class = http.client.HTTPSConnection if self.scheme == "https" else http.client.HTTPConnection
+        return connection_class(self.host, self.port, timeout=self.connect_timeout)
+
+    def _acquire(self) -> http.client.HTTPConnection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return self._new_connection()
+
+    def _release(self, conn: http.client.HTTPConnection) -> None:
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def _write(self, conn: http.client.HTTPConnection, method: str, path: str, body: Optional[bytes], headers: Dict[str, str], read_timeout: float) -> None:
+        if conn.sock is None:
+            conn.timeout = min(self.connect_timeout, read_timeout)
+            conn.connect()
+        conn.sock.settimeout(read_timeout)
+        conn.request(method, path, body=body, headers=headers)
+
+    @staticmethod
+    def _read(conn: http.client.HTTPConnection) -> Tuple[int, Dict[str, str], bytes, bool]:
+        resp = conn.getresponse()
+        data = resp.read()
+        return resp.status, dict(resp.getheaders()), data, resp.will_close
+
+    def _send(self, conn: http.client.HTTPConnection, method: str, path: str, body: Optional[bytes], headers: Dict[str, str], read_timeout: float, reused: bool) -> Tuple[int, Dict[str, str], bytes, bool]:
+        try:
+            self._write(conn, method, path, body, headers, read_timeout)
+        except self._STALE_ERRORS:
+            if not reused:
+                raise
+            conn.close()
+            self._write(conn, method, path, body, headers, read_timeout)
+            return self._read(conn)
+
+        try:
+            return self._read(conn)
+        except self._STALE_ERRORS:
+            replayable = method.upper() in _IDEMPOTENT_METHODS or "Idempotency-Key" in headers
+            if not (reused and replayable):
+                raise
+            conn.close()
+            self._write(conn, method, path, body, headers, read_timeout)
+            return self._read(conn)
+
+    def request(self, method: str, path: str, body: Optional[bytes] = None, headers: Optional[Dict[str, str]] = None, read_timeout: Optional[float] = None) -> Tuple[int, Dict[str, str], bytes]:
+        headers = headers or {}
+        deadline = request_deadline()
+        read_timeout = deadline.timeout(read_timeout or self.read_timeout)
+        conn = self._acquire()
+        reused = conn.sock is not None
+        try:
+            with metrics.span(self.upstream, _span_operation(method, path), len(body or b"")) as span:
+                status, response_headers, data, will_close = self._send(conn, method, path, body, headers, read_timeout, reused)
+                span["status"] = status
+                span["bytes_in"] = len(data)
+        except Exception as e:
+            conn.close()
+            if deadline.expired() and not isinstance(e, DeadlineExceeded):
+                raise DeadlineExceeded(_NOT_PROCESSED) from e
+            raise
+
+        if will_close:
+            conn.close()
+        else:
+            self._release(conn)
+        return status, response_headers, data
+
+
+@functools.lru_cache(maxsize=None)
+def _stripe_http() -> HttpConnectionPool:
+    return HttpConnectionPool(STRIPE_API_BASE, STRIPE_POOL_SIZE, STRIPE_CONNECT_TIMEOUT, STRIPE_READ_TIMEOUT, upstream="stripe")
+
 def _http_response(status_code: int, body: Dict[str, Any]) -> Dict[str, Any]:
     return {
         "statusCode": status_code,
@@ -58,13 +759,61 @@ def _parse_event_body(event: Dict[str, Any]) -> Dict[str, Any]:
     except json.JSONDecodeError:
         return {}
 
-def create_checkout_session(event: Dict[str, Any]) -> Dict[str, Any]:
-    logger.info("checkout: start")
-    if not STRIPE_API_KEY:
-        logger.error("checkout: STRIPE_API_KEY not set")
-        return _http_response(500, {"error": "STRIPE_API_KEY is not set"})
+class CheckoutSessionCache:
+    """Recently created checkout sessions by idempotency key, kept until the session expires"""
 
-    payload = _parse_event_body(event)
+    def __init__(self, max_entries: int) -> None:
+        from collections import OrderedDict
+
+        self.max_entries = max_entries
+        self._sessions: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is None:
+                return None
+            if (session.get("expires_at") or 0) <= time.time():
+                del self._sessions[key]
+                return None
+            self._sessions.move_to_end(key)
+            return session
+
+    def put(self, key: str, session: Dict[str, Any]) -> None:
+        if (session.get("expires_at") or 0) <= time.time():
+            return
+        with self._lock:
+            self._sessions[key] = session
+            self._sessions.move_to_end(key)
+            while len(self._sessions) > self.max_entries:
+                self._sessions.popitem(last=False)
+
+
+_checkout_session_cache = CheckoutSessionCache(STRIPE_CHECKOUT_CACHE_SIZE)
+
+
+def _checkout_idempotency_key(payload: Dict[str, Any], form_data: bytes) -> Optional[str]:
+    """Explicit idempotency_key, or one derived from metadata[order_id] when opted in"""
+    if payload.get("idempotency_key"):
+        return str(payload["idempotency_key"])
+    if not (payload.get("idempotent") or STRIPE_CHECKOUT_IDEMPOTENT):
+        return None
+
+    order_id = (payload.get("metadata") or {}).get("order_id") or payload.get("metadata[order_id]")
+    if not order_id:
+        return None
+
+    import hashlib
+
+    # Include the form so a changed cart for the same order gets a new session
+    # instead of Stripe rejecting the reused key with different parameters.
+    digest = hashlib.sha256(form_data).hexdigest()[:16]
+    return f"checkout-{order_id}-{digest}"
+
+
+def _prepare_checkout_form(payload: Dict[str, Any]) -> Tuple[Optional[Dict[str, Any]], Optional[Tuple[int, Dict[str, Any]]]]:
+    """Validate a checkout payload and build the Stripe form, or return (status, error body)"""
     amount = payload.get("amount")
     if amount is None:
         amount = payload.get("line_items[0][price_data][unit_amount]")
@@ -79,24 +828,24 @@ def create_checkout_session(event: Dict[str, Any]) -> Dict[str, Any]:
         quantity = payload.get("line_items[0][quantity]")
     if amount is None:
         logger.warning("checkout: missing amount")
-        return _http_response(400, {"error": "Missing required parameter: amount"})
+        return None, (400, {"error": "Missing required parameter: amount"})
 
     try:
         amount_int = int(amount)
     except (TypeError, ValueError):
         logger.warning("checkout: invalid amount")
-        return _http_response(400, {"error": "amount must be an integer (in smallest currency unit)"})
+        return None, (400, {"error": "amount must be an integer (in smallest currency unit)"})
 
     if amount_int <= 0:
         logger.warning("checkout: amount <= 0")
-        return _http_response(400, {"error": "amount must be greater than 0"})
+        return None, (400, {"error": "amount must be greater than 0"})
 
     currency = currency or DEFAULT_CURRENCY
     success_url = payload.get("success_url")
     cancel_url = payload.get("cancel_url")
     if not success_url or not cancel_url:
         logger.warning("checkout: missing success/cancel url")
-        return _http_response(400, {"error": "Missing required parameters: success_url, cancel_url"})
+        return None, (400, {"error": "Missing required parameters: success_url, cancel_url"})
 
     metadata = payload.get("metadata") or {}
     mode = payload.get("mode") or "payment"
@@ -147,31 +896,330 @@ def create_checkout_session(event: Dict[str, Any]) -> Dict[str, Any]:
         if payment_method_types:
             for idx, method in enumerate(payment_method_types):
                 form.setdefault(f"payment_method_types[{idx}]", method)
+    except Exception as exc:
+        logger.exception("checkout: stripe error")
+        return None, (500, {"error": "Stripe error", "detail": str(exc)})
 
-        url = "https://api.stripe.com/v1/checkout/sessions"
+    return form, None
+
+
+def _submit_checkout_form(payload: Dict[str, Any], form: Dict[str, Any]) -> Tuple[int, Dict[str, Any]]:
+    """POST a prepared form to Stripe, returning (status, response body)"""
+    try:
         data = urllib.parse.urlencode(form).encode("utf-8")
-        
-        req = urllib.request.Request(url, data=data, method="POST")
-        req.add_header("Authorization", f"Bearer {STRIPE_API_KEY}")
-        req.add_header("Content-Type", "application/x-www-form-urlencoded")
 
-        with urllib.request.urlopen(req, timeout=120) as resp:            
-            response_body = resp.read().decode("utf-8")
-            session = json.loads(response_body)
-    except urllib.error.HTTPError as http_err:
-        error_body = http_err.read().decode("utf-8")
+        idempotency_key = _checkout_idempotency_key(payload, data)
+        if idempotency_key:
+            cached_session = _checkout_session_cache.get(idempotency_key)
+            if cached_session is not None:
+                logger.info("checkout: reusing session %s", cached_session.get("id"))
+                return 200, {"session": cached_session}
+        
+        headers = {
+            "Authorization": f"Bearer {STRIPE_API_KEY}",
+            "Content-Type": "application/x-www-form-urlencoded"
+        }
+        # Without a caller key, a per-request one still lets a POST lost on a
+        # stale connection be resent without creating a second session
+        headers["Idempotency-Key"] = idempotency_key or str(uuid.uuid4())
+        status, _, response_body = _stripe_http().request("POST", "/v1/checkout/sessions", body=data, headers=headers)
+        if status >= 400:
+            raise HttpStatusError(status, response_body)
+        session = json.loads(response_body.decode("utf-8"))
+        if idempotency_key:
+            _checkout_session_cache.put(idempotency_key, session)
+    except HttpStatusError as http_err:
+        error_body = http_err.body.decode("utf-8")
         try:
             error_detail = json.loads(error_body)
         except:
             error_detail = error_body
         logger.exception("checkout: stripe error")
-        return _http_response(500, {"error": "Stripe error", "detail": error_detail})
+        return 500, {"error": "Stripe error", "detail": error_detail}
     except Exception as exc:
         logger.exception("checkout: stripe error")
-        return _http_response(500, {"error": "Stripe error", "detail": str(exc)})
+        return 500, {"error": "Stripe error", "detail": str(exc)}
 
     logger.info("checkout: created session %s", session.get("id"))
-    return _http_response(200, {"session": session})
+    return 200, {"session": session}
+
+
+def create_checkout_session(event: Dict[str, Any]) -> Dict[str, Any]:
+    logger.info("checkout: start")
+    if not STRIPE_API_KEY:
+        logger.error("checkout: STRIPE_API_KEY not set")
+        return _http_response(500, {"error": "STRIPE_API_KEY is not set"})
+
+    payload = _parse_event_body(event)
+    form, error = _prepare_checkout_form(payload)
+    if error:
+        return _http_response(*error)
+    return _http_response(*_submit_checkout_form(payload, form))
+
+
+def create_checkout_sessions(payloads: list, max_workers: Optional[int] = None, deadline: Optional[Deadline] = None) -> Dict[str, Any]:
+    """Create several checkout sessions concurrently after validating all of them.
+
+    If any payload is invalid nothing is sent to Stripe. Otherwise results
+    hold one {"session": ...} or {"error": ..., "detail": ...} per payload,
+    in input order.
+    """
+    logger.info("checkout_batch: start")
+    if not STRIPE_API_KEY:
+        logger.error("checkout_batch: STRIPE_API_KEY not set")
+        return _http_response(500, {"error": "STRIPE_API_KEY is not set"})
+    if not isinstance(payloads, list) or not payloads:
+        return _http_response(400, {"error": "sessions must be a non-empty list"})
+
+    payloads = [payload if isinstance(payload, dict) else {} for payload in payloads]
+    prepared = [_prepare_checkout_form(payload) for payload in payloads]
+    if any(error for _, error in prepared):
+        logger.warning("checkout_batch: invalid payloads; nothing created")
+        return _http_response(400, {
+            "error": "Invalid checkout payloads",
+            "results": [error[1] if error else {"valid": True} for _, error in prepared]
+        })
+
+    from concurrent.futures import ThreadPoolExecutor
+
+    workers = max(1, min(int(max_workers or STRIPE_POOL_SIZE), len(payloads)))
+    deadline = deadline or request_deadline()
+
+    def submit(payload: Dict[str, Any], form: Dict[str, Any]) -> Tuple[int, Dict[str, Any]]:
+        if deadline.expired():
+            return 504, {"error": _NOT_PROCESSED}
+        return _submit_checkout_form(payload, form)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(submit, payloads, [form for form, _ in prepared]))
+
+    status = 200 if all(result_status == 200 for result_status, _ in results) else 500
+    unprocessed = [index for index, (result_status, _) in enumerate(results) if result_status == 504]
+    return _http_response(status, {"results": [result for _, result in results], "unprocessed": unprocessed})
+
+class SqliteOutbox:
+    """Durable local outbox backed by SQLite, a stand-in for a managed queue.
+
+    Point the database at shared storage (for example an EFS mount) when
+    more than one container must drain it; /tmp only survives within one.
+    Rows are claimed with a lease so concurrent drains never deliver the
+    same row twice, and failed rows go back to pending until max_attempts.
+    """
+
+    def __init__(self, path: str, max_attempts: int = 10, lease_seconds: int = 300) -> None:
+        self.path = path
+        self.max_attempts = max_attempts
+        self.lease_seconds = lease_seconds
+        self._initialized = False
+        self._init_lock = threading.Lock()
+
+    def _connect(self) -> Any:
+        import sqlite3
+
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        if not self._initialized:
+            with self._init_lock:
+                if not self._initialized:
+                    conn.execute(
+                        "CREATE TABLE IF NOT EXISTS outbox ("
+                        "id INTEGER PRIMARY KEY AUTOINCREMENT, payload TEXT NOT NULL, "
+                        "status TEXT NOT NULL DEFAULT 'pending', attempts INTEGER NOT NULL DEFAULT 0, "
+                        "last_error TEXT, result TEXT, claimed_until REAL NOT NULL DEFAULT 0, "
+                        "created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+                    )
+                    conn.execute("CREATE INDEX IF NOT EXISTS outbox_pending ON outbox (status, id)")
+                    self._initialized = True
+        return conn
+
+    def enqueue(self, payload: Dict[str, Any]) -> int:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        now = time.time()
+        conn = self._connect()
+        try:
+            cursor = conn.execute(
+                "INSERT INTO outbox (payload, created_at, updated_at) VALUES (?, ?, ?)",
+                (json.dumps(payload), now, now)
+            )
+            return cursor.lastrowid
+        finally:
+            conn.close()
+
+    def claim(self, limit: int) -> list:
+        """Lease up to limit pending rows, returning (id, payload, attempts) tuples"""
+        if not os.path.exists(self.path):
+            return []
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            rows = conn.execute(
+                "SELECT id, payload, attempts FROM outbox WHERE status = 'pending' AND claimed_until < ? ORDER BY id LIMIT ?",
+                (now, limit)
+            ).fetchall()
+            conn.executemany(
+                "UPDATE outbox SET claimed_until = ? WHERE id = ?",
+                [(now + self.lease_seconds, row[0]) for row in rows]
+            )
+            conn.execute("COMMIT")
+            return [(row[0], json.loads(row[1]), row[2]) for row in rows]
+        finally:
+            conn.close()
+
+    def complete(self, row_id: int, result: Optional[Dict[str, Any]] = None) -> None:
+        conn = self._connect()
+        try:
+            conn.execute(
+                "UPDATE outbox SET status = 'delivered', attempts = attempts + 1, result = ?, last_error = NULL, updated_at = ? WHERE id = ?",
+                (json.dumps(result) if result is not None else None, time.time(), row_id)
+            )
+        finally:
+            conn.close()
+
+    def fail(self, row_id: int, error: str) -> None:
+        conn = self._connect()
+        try:
+            conn.execute(
+                "UPDATE outbox SET attempts = attempts + 1, last_error = ?, claimed_until = 0, updated_at = ?, "
+                "status = CASE WHEN attempts + 1 >= ? THEN 'failed' ELSE 'pending' END WHERE id = ?",
+                (error, time.time(), self.max_attempts, row_id)
+            )
+        finally:
+            conn.close()
+
+    def release(self, row_ids: list) -> None:
+        """Return claimed rows to pending without counting a delivery attempt"""
+        if not row_ids:
+            return
+        conn = self._connect()
+        try:
+            conn.executemany("UPDATE outbox SET claimed_until = 0 WHERE id = ?", [(row_id,) for row_id in row_ids])
+        finally:
+            conn.close()
+
+    def status(self, row_ids: list) -> Dict[int, Dict[str, Any]]:
+        if not row_ids or not os.path.exists(self.path):
+            return {}
+        conn = self._connect()
+        try:
+            placeholders = ",".join("?" for _ in row_ids)
+            rows = conn.execute(
+                f"SELECT id, status, attempts, last_error, result, updated_at FROM outbox WHERE id IN ({placeholders})",
+                [int(row_id) for row_id in row_ids]
+            ).fetchall()
+        finally:
+            conn.close()
+        return {
+            row[0]: {
+                "status": row[1],
+                "attempts": row[2],
+                "error": row[3],
+                "result": json.loads(row[4]) if row[4] else None,
+                "updated_at": row[5]
+            }
+            for row in rows
+        }
+
+
+@functools.lru_cache(maxsize=None)
+def _webhook_outbox() -> SqliteOutbox:
+    return SqliteOutbox(WEBHOOK_OUTBOX_PATH, max_attempts=WEBHOOK_OUTBOX_MAX_ATTEMPTS)
+
+
+def _invoke_target_lambda(payload: str, invocation_type: str) -> Dict[str, Any]:
+    request_deadline().check()
+    with metrics.span("lambda", f"invoke {invocation_type}", len(payload.encode("utf-8"))) as span:
+        response = _get_aws_client("lambda").invoke(
+            FunctionName=WEBHOOK_TARGET_LAMBDA_ARN,
+            InvocationType=invocation_type,
+            Payload=payload
+        )
+        span["status"] = response.get("StatusCode")
+    if response.get("FunctionError"):
+        raise RuntimeError(f"Target lambda returned {response['FunctionError']}")
+    return {"status_code": response.get("StatusCode")}
+
+
+def drain_webhook_outbox(batch_size: Optional[int] = None) -> Dict[str, Any]:
+    """Deliver queued webhook events to the target Lambda in batches"""
+    if not WEBHOOK_TARGET_LAMBDA_ARN:
+        return {"success": False, "error": "WEBHOOK_TARGET_LAMBDA_ARN not set"}
+    if not WEBHOOK_OUTBOX_PATH:
+        return {"success": False, "error": "WEBHOOK_OUTBOX_PATH not set"}
+
+    outbox = _webhook_outbox()
+    deadline = request_deadline()
+    delivered, failed = 0, 0
+    rows = outbox.claim(int(batch_size or WEBHOOK_OUTBOX_BATCH_SIZE))
+    for position, (row_id, item, _) in enumerate(rows):
+        if deadline.expired():
+            outbox.release([row[0] for row in rows[position:]])
+            return {"success": True, "delivered": delivered, "failed": failed, "unprocessed": len(rows) - position}
+        try:
+            outbox.complete(row_id, _invoke_target_lambda(item["payload"], "Event"))
+            delivered += 1
+        except Exception as e:
+            logger.exception("webhook_outbox: delivery of %s failed", row_id)
+            outbox.fail(row_id, str(e))
+            failed += 1
+    return {"success": True, "delivered": delivered, "failed": failed}
+
+
+_JSON_DECODER = json.JSONDecoder()
+_JSON_WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+
+def _scan_json_object(text: str, index: int, path: Tuple[str, ...]) -> Tuple[Dict[str, Any], int, Optional[Tuple[int, int]]]:
+    """Decode the JSON object at text[index] and locate the raw span of the value at path.
+
+    Every value is decoded exactly once by the C scanner; objects along path
+    are walked member by member so the span comes out of the same pass.
+    """
+    if text[index] != "{":
+        raise ValueError(f"Expecting object at char {index}")
+    obj: Dict[str, Any] = {}
+    span = None
+    index = _JSON_WHITESPACE.match(text, index + 1).end()
+    if text[index] == "}":
+        return obj, index + 1, None
+
+    while True:
+        if text[index] != '"':
+            raise ValueError(f"Expecting property name at char {index}")
+        key, index = json.decoder.scanstring(text, index + 1)
+        index = _JSON_WHITESPACE.match(text, index).end()
+        if text[index] != ":":
+            raise ValueError(f"Expecting ':' at char {index}")
+        start = _JSON_WHITESPACE.match(text, index + 1).end()
+
+        if path and key == path[0] and len(path) > 1 and text[start] == "{":
+            value, index, span = _scan_json_object(text, start, path[1:])
+        else:
+            value, index = _JSON_DECODER.raw_decode(text, start)
+            if path and key == path[0] and len(path) == 1:
+                span = (start, index)
+        obj[key] = value
+
+        index = _JSON_WHITESPACE.match(text, index).end()
+        if text[index] == ",":
+            index = _JSON_WHITESPACE.match(text, index + 1).end()
+        elif text[index] == "}":
+            return obj, index + 1, span
+        else:
+            raise ValueError(f"Expecting ',' or '}}' at char {index}")
+
+
+def _parse_stripe_event(payload: str) -> Tuple[Dict[str, Any], str]:
+    """Parse a verified webhook body once, returning the event and the raw data.object JSON"""
+    start = _JSON_WHITESPACE.match(payload).end()
+    stripe_event, end, span = _scan_json_object(payload, start, ("data", "object"))
+    end = _JSON_WHITESPACE.match(payload, end).end()
+    if end != len(payload):
+        raise ValueError(f"Extra data at char {end}")
+    object_json = payload[span[0]:span[1]] if span else "{}"
+    return stripe_event, object_json
+
 
 def stripe_webhook(event: Dict[str, Any]) -> Dict[str, Any]:
     logger.info("webhook: start")
@@ -179,6 +1227,11 @@ def stripe_webhook(event: Dict[str, Any]) -> Dict[str, Any]:
         logger.error("webhook: STRIPE_WEBHOOK_SECRET not set")
         return _http_response(500, {"error": "STRIPE_WEBHOOK_SECRET is not set"})
 
+    if WEBHOOK_TARGET_LAMBDA_ARN and WEBHOOK_FORWARD_MODE == "outbox" and not WEBHOOK_OUTBOX_PATH:
+        # Acknowledging an event that only lands in this container's /tmp would lose it
+        logger.error("webhook: outbox mode requires WEBHOOK_OUTBOX_PATH")
+        return _http_response(500, {"error": "WEBHOOK_OUTBOX_PATH is not set"})
+
     payload = event.get("body") or ""
     if event.get("isBase64Encoded"):
         import base64
@@ -191,47 +1244,144 @@ def stripe_webhook(event: Dict[str, Any]) -> Dict[str, Any]:
         return _http_response(400, {"error": "Missing Stripe signature"})
 
     try:
-        stripe_event = stripe.Webhook.construct_event(payload, signature, STRIPE_WEBHOOK_SECRET)
-        stripe_event = json.loads(str(stripe_event))
+        # Verify the signature over the raw body without building a StripeObject
+        stripe = _stripe()
+        stripe.WebhookSignature.verify_header(payload, signature, STRIPE_WEBHOOK_SECRET, stripe.Webhook.DEFAULT_TOLERANCE)
     except Exception as exc:
         logger.warning("webhook: invalid signature")
         return _http_response(400, {"error": "Invalid webhook signature", "detail": str(exc)})
 
+    try:
+        stripe_event, object_json = _parse_stripe_event(payload)
+    except (ValueError, IndexError) as exc:
+        logger.warning("webhook: invalid payload")
+        return _http_response(400, {"error": "Invalid webhook payload", "detail": str(exc)})
+
     event_type = stripe_event.get("type")
     logger.info("webhook: verified event %s (%s)", stripe_event.get("id"), event_type)
+
+    idempotency_key = f"stripe:{stripe_event.get('id')}"
+    if stripe_event.get("id") and not idempotency_guard.claim(idempotency_key):
+        logger.info("webhook: duplicate event %s; skipping", stripe_event.get("id"))
+        return _http_response(200, {
+            "received": True,
+            "duplicate": True,
+            "event_type": event_type,
+            "event_id": stripe_event.get("id"),
+        })
     
     if WEBHOOK_TARGET_LAMBDA_ARN:
-        try:
-            lambda_client = boto3.client("lambda")
-            lambda_client.invoke(
-                FunctionName=WEBHOOK_TARGET_LAMBDA_ARN,
-                InvocationType="RequestResponse",
-                Payload=json.dumps({
-                    "action": "process_webhook",
-                    "webhook_event": {
-                        "type": event_type,
-                        "id": stripe_event.get("id"),
-                        "data": json.dumps(stripe_event.get("data", {}).get("object", {}))
-                    }
-                })
-            )
-            logger.info("webhook: forwarded event to target lambda")
-        except Exception:
-            logger.exception("webhook: failed to invoke target lambda")
+        forward_payload = json.dumps({
+            "action": "process_webhook",
+            "webhook_event": {
+                "type": event_type,
+                "id": stripe_event.get("id"),
+                "data": object_json
+            }
+        })
+        if WEBHOOK_FORWARD_MODE == "outbox":
+            # Acknowledge only once the event is persisted; Stripe retries otherwise
+            try:
+                _webhook_outbox().enqueue({"payload": forward_payload})
+                logger.info("webhook: queued event in outbox")
+            except Exception as exc:
+                logger.exception("webhook: failed to persist event")
+                idempotency_guard.release(idempotency_key)
+                return _http_response(500, {"error": "Failed to persist webhook event", "detail": str(exc)})
+            if WEBHOOK_OUTBOX_DRAIN_ON_RECEIVE > 0:
+                # Nothing else may drain the outbox, so each webhook delivers a few pending rows
+                try:
+                    drained = drain_webhook_outbox(WEBHOOK_OUTBOX_DRAIN_ON_RECEIVE)
+                    logger.info("webhook: drained outbox (%s delivered, %s failed)", drained.get("delivered"), drained.get("failed"))
+                except Exception:
+                    logger.exception("webhook: failed to drain outbox")
+        else:
+            invocation_type = "Event" if WEBHOOK_FORWARD_MODE == "event" else "RequestResponse"
+            try:
+                _invoke_target_lambda(forward_payload, invocation_type)
+                logger.info("webhook: forwarded event to target lambda")
+            except Exception:
+                logger.exception("webhook: failed to invoke target lambda")
+                idempotency_guard.release(idempotency_key)
     else:
         logger.warning("webhook: WEBHOOK_TARGET_LAMBDA_ARN not set; skipping invoke")
         
-    event_data = stripe_event.get("data", {}).get("object", {})
-    
-    return _http_response(
-        200,
-        {
-            "received": True,
-            "event_type": event_type,
-            "event_id": stripe_event.get("id"),
-            "object": event_data,
-        },
-    )
+    response_body = json.dumps({
+        "received": True,
+        "event_type": event_type,
+        "event_id": stripe_event.get("id"),
+    })
+    if STRIPE_WEBHOOK_RESPONSE_OBJECT:
+        # Splice the already-serialized object in instead of dumping it again
+        response_body = f'{response_body[:-1]}, "object": {object_json}}}'
+
+    return {
+        "statusCode": 200,
+        "headers": {"Content-Type": "application/json"},
+        "body": response_body,
+    }
+
+def _attachment_bytes(attachment: Dict[str, Any]) -> bytes:
+    # Internal callers hand over raw bytes or a file-like object under "data";
+    # the public API still sends base64 text under "content".
+    data = attachment.get("data")
+    if data is None:
+        import base64
+
+        return base64.b64decode(attachment["content"])
+    if hasattr(data, "read"):
+        return data.read()
+    return data
+
+
+def _build_mime_message(from_email: str, to_email: str, subject: str, body: str, is_html: bool = False, attachment: Dict[str, Any] = None) -> Any:
+    MIMEMultipart = _lazy_import("email.mime.multipart").MIMEMultipart
+    MIMEText = _lazy_import("email.mime.text").MIMEText
+    MIMEApplication = _lazy_import("email.mime.application").MIMEApplication
+
+    msg = MIMEMultipart()
+    msg['Subject'] = subject
+    msg['From'] = from_email
+    msg['To'] = to_email
+
+    msg.attach(MIMEText(body, 'html' if is_html else 'plain'))
+
+    if attachment:
+        # MIMEApplication base64-encodes the bytes once for transport
+        att = MIMEApplication(_attachment_bytes(attachment))
+        att.add_header('Content-Disposition', 'attachment', filename=attachment['filename'])
+        msg.attach(att)
+    return msg
+
+
+_SES_THROTTLING_CODES = ("Throttling", "ThrottlingException", "TooManyRequestsException")
+
+
+def _ses_call(operation: str, bytes_out: int = 0, **kwargs: Any) -> Dict[str, Any]:
+    """Call an SES operation under the shared send-rate limiter, retrying throttling errors"""
+    client = _get_aws_client("ses", APP_AWS_REGION)
+    limiter = rate_limiters["ses"]
+    deadline = request_deadline()
+    attempt = 0
+    while True:
+        limiter.acquire()
+        deadline.check()
+        try:
+            with metrics.span("ses", operation, bytes_out) as span:
+                response = getattr(client, operation)(**kwargs)
+                span["status"] = (response.get("ResponseMetadata") or {}).get("HTTPStatusCode", "ok")
+            return response
+        except Exception as e:
+            code = (getattr(e, "response", None) or {}).get("Error", {}).get("Code")
+            if code not in _SES_THROTTLING_CODES or attempt >= THROTTLE_MAX_RETRIES:
+                raise
+            delay = _throttle_delay(attempt)
+            if delay >= deadline.remaining():
+                raise
+            logger.warning("ses: %s throttled (%s), retrying in %.2fs", operation, code, delay)
+            limiter.defer(delay)
+            attempt += 1
+
 
 def send_email(to_email: str, subject: str, body: str, is_html: bool = False, attachment: Dict[str, Any] = None) -> Dict[str, Any]:
     """Send email using AWS SES with optional attachment"""
@@ -239,31 +1389,16 @@ def send_email(to_email: str, subject: str, body: str, is_html: bool = False, at
         return {"success": False, "error": "SES from email not configured"}
     
     try:
-        import base64
-        from email.mime.multipart import MIMEMultipart
-        from email.mime.text import MIMEText
-        from email.mime.application import MIMEApplication
-        
-        ses_client = boto3.client('ses', region_name=APP_AWS_REGION)
-        
         if attachment:
-            # Use raw email for attachments
-            msg = MIMEMultipart()
-            msg['Subject'] = subject
-            msg['From'] = SES_FROM_EMAIL
-            msg['To'] = to_email
-            
-            msg.attach(MIMEText(body, 'html' if is_html else 'plain'))
-            
-            # Add attachment
-            att = MIMEApplication(base64.b64decode(attachment['content']))
-            att.add_header('Content-Disposition', 'attachment', filename=attachment['filename'])
-            msg.attach(att)
-            
-            response = ses_client.send_raw_email(
+            # Use raw email for attachments, serialized to bytes exactly once
+            msg = _build_mime_message(SES_FROM_EMAIL, to_email, subject, body, is_html, attachment)
+            raw_message = msg.as_bytes()
+            response = _ses_call(
+                "send_raw_email",
+                bytes_out=len(raw_message),
                 Source=SES_FROM_EMAIL,
                 Destinations=[to_email],
-                RawMessage={'Data': msg.as_string()}
+                RawMessage={'Data': raw_message}
             )
         else:
             # Use simple email without attachments
@@ -273,7 +1408,9 @@ def send_email(to_email: str, subject: str, body: str, is_html: bool = False, at
             else:
                 message_body['Text'] = {'Data': body}
             
-            response = ses_client.send_email(
+            response = _ses_call(
+                "send_email",
+                bytes_out=len(body.encode("utf-8")),
                 Source=SES_FROM_EMAIL,
                 Destination={'ToAddresses': [to_email]},
                 Message={
@@ -287,40 +1424,261 @@ def send_email(to_email: str, subject: str, body: str, is_html: bool = False, at
         return {"success": False, "error": str(e)}
 
 
+@functools.lru_cache(maxsize=None)
+def _email_outbox() -> SqliteOutbox:
+    return SqliteOutbox(EMAIL_OUTBOX_PATH, max_attempts=EMAIL_OUTBOX_MAX_ATTEMPTS)
+
+
+def enqueue_email(to_email: str, subject: str, body: str, is_html: bool = False, attachment: Dict[str, Any] = None) -> Dict[str, Any]:
+    """Validate an email and queue it for drain_email_outbox, then deliver a few pending rows"""
+    if not SES_FROM_EMAIL:
+        return {"success": False, "error": "SES from email not configured"}
+    if not EMAIL_OUTBOX_PATH:
+        return {"success": False, "error": "EMAIL_OUTBOX_PATH not configured"}
+    if not all([to_email, subject, body]):
+        return {"success": False, "error": "Missing required parameters: to_email, subject, body"}
+
+    try:
+        item = {"to_email": to_email, "subject": subject, "body": body, "is_html": bool(is_html)}
+        if attachment:
+            import base64
+
+            if not attachment.get("filename"):
+                return {"success": False, "error": "Attachment filename is required"}
+            # Rows are JSON, so raw attachment bytes are stored as base64 "content";
+            # base64 from callers is checked here rather than failing at drain time.
+            if attachment.get("data") is not None:
+                content = base64.b64encode(_attachment_bytes(attachment)).decode("ascii")
+            else:
+                content = attachment.get("content") or ""
+                base64.b64decode(content, validate=True)
+            item["attachment"] = {"filename": attachment["filename"], "content": content}
+        outbox_id = _email_outbox().enqueue(item)
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+
+    if EMAIL_OUTBOX_DRAIN_ON_ENQUEUE > 0:
+        # Nothing else may drain the outbox, so each enqueue delivers a few pending rows
+        try:
+            drain_email_outbox(EMAIL_OUTBOX_DRAIN_ON_ENQUEUE)
+        except Exception:
+            logger.exception("email_outbox: failed to drain outbox")
+    return {"success": True, "queued": True, "message": "Email queued", "outbox_id": outbox_id}
+
+
+def deliver_email(to_email: str, subject: str, body: str, is_html: bool = False, attachment: Dict[str, Any] = None) -> Dict[str, Any]:
+    """Send the email now or queue it, depending on EMAIL_DELIVERY_MODE"""
+    if EMAIL_DELIVERY_MODE == "outbox":
+        return enqueue_email(to_email, subject, body, is_html, attachment)
+    return send_email(to_email, subject, body, is_html, attachment)
+
+
+def drain_email_outbox(batch_size: Optional[int] = None, max_workers: Optional[int] = None) -> Dict[str, Any]:
+    """Deliver queued emails through the shared SES client in batches"""
+    if not SES_FROM_EMAIL:
+        return {"success": False, "error": "SES from email not configured"}
+    if not EMAIL_OUTBOX_PATH:
+        return {"success": False, "error": "EMAIL_OUTBOX_PATH not configured"}
+
+    from concurrent.futures import ThreadPoolExecutor
+
+    outbox = _email_outbox()
+    rows = outbox.claim(int(batch_size or EMAIL_OUTBOX_BATCH_SIZE))
+    if not rows:
+        return {"success": True, "sent": 0, "failed": 0}
+
+    deadline = request_deadline()
+
+    def deliver(row: Tuple[int, Dict[str, Any], int]) -> Optional[bool]:
+        row_id, item, _ = row
+        if deadline.expired():
+            outbox.release([row_id])
+            return None
+        result = send_email(item["to_email"], item["subject"], item["body"], item.get("is_html", False), item.get("attachment"))
+        if result.get("success"):
+            outbox.complete(row_id, {"messageId": result.get("messageId")})
+            return True
+        logger.warning("email_outbox: delivery of %s failed: %s", row_id, result.get("error"))
+        outbox.fail(row_id, str(result.get("error")))
+        return False
+
+    # The SES client is thread-safe and its urllib3 pool holds
+    # AWS_MAX_POOL_CONNECTIONS connections, so the batch is sent concurrently.
+    workers = max(1, min(int(max_workers or AWS_MAX_POOL_CONNECTIONS), len(rows)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        outcomes = list(executor.map(deliver, rows))
+    sent = outcomes.count(True)
+    return {"success": True, "sent": sent, "failed": outcomes.count(False), "unprocessed": outcomes.count(None)}
+
+
+def get_email_outbox_status(outbox_ids: list) -> Dict[str, Any]:
+    """Look up the delivery outcome of queued emails by outbox id"""
+    if not isinstance(outbox_ids, list) or not outbox_ids:
+        return {"success": False, "error": "outbox_ids must be a non-empty list"}
+    if not EMAIL_OUTBOX_PATH:
+        return {"success": False, "error": "EMAIL_OUTBOX_PATH not configured"}
+    try:
+        statuses = _email_outbox().status(outbox_ids)
+    except (TypeError, ValueError):
+        return {"success": False, "error": "outbox_ids must be integers"}
+    return {
+        "success": True,
+        "results": {str(row_id): statuses.get(int(row_id), {"status": "unknown"}) for row_id in outbox_ids}
+    }
+
+class SmtpConnectionPool:
+    """Authenticated SMTP connections kept open across warm invocations.
+
+    A connection idle for longer than noop_after seconds is probed with NOOP
+    before reuse and replaced if the server has dropped it; a message that
+    hits a disconnect mid-send is retried once on a fresh connection.
+    """
+
+    _NOT_SENT = "Not sent: SMTP connection lost before this message"
+
+    def __init__(self, host: str, port: int, user: str, password: str, pool_size: int, timeout: float, noop_after: float) -> None:
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.timeout = timeout
+        self.noop_after = noop_after
+        self._idle: queue.LifoQueue = queue.LifoQueue(maxsize=max(1, pool_size))
+
+    def _connect(self) -> Any:
+        import smtplib
+
+        server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            server.starttls()
+            server.login(self.user, self.password)
+        except Exception:
+            server.close()
+            raise
+        return server
+
+    @staticmethod
+    def _is_alive(server: Any) -> bool:
+        try:
+            return server.noop()[0] == 250
+        except Exception:
+            return False
+
+    def acquire(self) -> Any:
+        while True:
+            try:
+                server, released_at = self._idle.get_nowait()
+            except queue.Empty:
+                return self._connect()
+            if time.monotonic() - released_at < self.noop_after or self._is_alive(server):
+                return server
+            server.close()
+
+    def release(self, server: Any) -> None:
+        try:
+            self._idle.put_nowait((server, time.monotonic()))
+        except queue.Full:
+            try:
+                server.quit()
+            except Exception:
+                server.close()
+
+    def send_messages(self, messages: list) -> list:
+        """Send MIME messages over one session; returns None or an error string per message.
+
+        Outcomes are recorded as each message goes out. If the connection is
+        lost for good (or any non-SMTP error occurs) the failing message gets
+        the error and the messages after it are reported as not processed, so
+        callers never see mail that was sent reported as failed.
+        """
+        import smtplib
+
+        results: list = []
+        deadline = request_deadline()
+        server = self.acquire()
+        for position, msg in enumerate(messages):
+            if deadline.expired():
+                results.extend([_NOT_PROCESSED] * (len(messages) - position))
+                break
+            try:
+                server.sock.settimeout(deadline.timeout(self.timeout))
+                try:
+                    server.send_message(msg)
+                except smtplib.SMTPServerDisconnected:
+                    server.close()
+                    server = self._connect()
+                    server.send_message(msg)
+                results.append(None)
+            except smtplib.SMTPServerDisconnected as e:
+                results.append(str(e) or "SMTP server disconnected")
+                results.extend([self._NOT_SENT] * (len(messages) - position - 1))
+                server.close()
+                return results
+            except smtplib.SMTPException as e:
+                results.append(str(e))
+            except Exception as e:
+                results.append(str(e))
+                results.extend([self._NOT_SENT] * (len(messages) - position - 1))
+                server.close()
+                return results
+        self.release(server)
+        return results
+
+
+@functools.lru_cache(maxsize=None)
+def _smtp_pool() -> SmtpConnectionPool:
+    return SmtpConnectionPool(
+        SMTP_GMAIL_HOST, int(SMTP_GMAIL_PORT), SMTP_GMAIL_USER, SMTP_GMAIL_PASSWORD,
+        SMTP_POOL_SIZE, SMTP_TIMEOUT, SMTP_NOOP_AFTER
+    )
+
+
 def send_email_smtp(to_email: str, subject: str, body: str, is_html: bool = False, attachment: Dict[str, Any] = None) -> Dict[str, Any]:
     """Send email using SMTP with optional attachment"""
     if not all([SMTP_GMAIL_HOST, SMTP_GMAIL_PORT, SMTP_GMAIL_USER, SMTP_GMAIL_PASSWORD]):
         return {"success": False, "error": "SMTP configuration missing"}
     
     try:
-        import smtplib
-        import base64
-        from email.mime.multipart import MIMEMultipart
-        from email.mime.text import MIMEText
-        from email.mime.application import MIMEApplication
-        
-        msg = MIMEMultipart()
-        msg['Subject'] = subject
-        msg['From'] = SMTP_GMAIL_USER
-        msg['To'] = to_email
-        
-        msg.attach(MIMEText(body, 'html' if is_html else 'plain'))
-        
-        if attachment:
-            att = MIMEApplication(base64.b64decode(attachment['content']))
-            att.add_header('Content-Disposition', 'attachment', filename=attachment['filename'])
-            msg.attach(att)
-        
-        with smtplib.SMTP(SMTP_GMAIL_HOST, int(SMTP_GMAIL_PORT)) as server:
-            server.starttls()
-            server.login(SMTP_GMAIL_USER, SMTP_GMAIL_PASSWORD)
-            server.send_message(msg)
-        
+        msg = _build_mime_message(SMTP_GMAIL_USER, to_email, subject, body, is_html, attachment)
+        error = _smtp_pool().send_messages([msg])[0]
+        if error:
+            return {"success": False, "error": error}
         return {"success": True, "message": "Email sent successfully via SMTP"}
     except Exception as e:
         return {"success": False, "error": str(e)}
 
 
+def send_emails_smtp(messages: list) -> Dict[str, Any]:
+    """Send many emails over one pooled SMTP session, with a result per message"""
+    if not all([SMTP_GMAIL_HOST, SMTP_GMAIL_PORT, SMTP_GMAIL_USER, SMTP_GMAIL_PASSWORD]):
+        return {"success": False, "error": "SMTP configuration missing"}
+    if not isinstance(messages, list) or not messages:
+        return {"success": False, "error": "messages must be a non-empty list"}
+
+    results: list = [None] * len(messages)
+    to_send = []
+    for index, item in enumerate(messages):
+        item = item if isinstance(item, dict) else {}
+        if not all([item.get("to_email"), item.get("subject"), item.get("body")]):
+            results[index] = {"success": False, "error": "Missing required parameters: to_email, subject, body"}
+            continue
+        try:
+            msg = _build_mime_message(SMTP_GMAIL_USER, item["to_email"], item["subject"], item["body"], item.get("is_html", False), item.get("attachment"))
+            to_send.append((index, msg))
+        except Exception as e:
+            results[index] = {"success": False, "error": str(e)}
+
+    try:
+        errors = _smtp_pool().send_messages([msg for _, msg in to_send]) if to_send else []
+    except Exception as e:
+        # send_messages only raises before anything was sent (e.g. connect or login failed)
+        errors = [str(e)] * len(to_send)
+    for (index, _), error in zip(to_send, errors):
+        results[index] = {"success": False, "error": error} if error else {"success": True, "message": "Email sent successfully via SMTP"}
+
+    return {"success": True, "results": results}
+
+
 def get_muinmos_token(grant_type: str, client_id: str, client_secret: str, username: str, password: str, api_url: str) -> Dict[str, Any]:
     """Get Muinmos authentication token"""
     if not all([grant_type, client_id, client_secret, username, password, api_url]):
@@ -331,8 +1689,7 @@ def get_muinmos_token(grant_type: str, client_id: str, client_secret: str, usern
         return {"success": False, "error": "api_url must start with http:// or https://"}
     
     try:
-        from curl_cffi import requests as curl_requests
-        resp = curl_requests.post(
+        resp = muinmos_client.post(
             api_url,
             data={
                 "grant_type": grant_type,
@@ -346,24 +1703,123 @@ def get_muinmos_token(grant_type: str, client_id: str, client_secret: str, usern
                 "X-Version": "2.0",
                 "Content-Type": "application/x-www-form-urlencoded"
             },
-            impersonate="chrome110",
-            timeout=30
+            timeout=30,
+            idempotent=True
         )
         if resp.status_code >= 400:
-            print(f"HTTP {resp.status_code} error body: {resp.text}")
+            logger.warning("muinmos: HTTP %s error body: %s", resp.status_code, resp.text)
             return {"success": False, "error": f"HTTP {resp.status_code}", "response_body": resp.text}
         return {"success": True, "token_data": resp.json()}
     except Exception as e:
         return {"success": False, "error": f"Request failed: {str(e)}"}
 
 
+# Muinmos tokens cached per (api_url, grant_type, client_id, username, secret digest)
+# until shortly before they expire. The digest covers client_secret and password,
+# so a caller with wrong credentials never gets another caller's token. Each key
+# has its own lock so concurrent refreshes collapse into a single password-grant request.
+_muinmos_tokens: Dict[Tuple[str, ...], Dict[str, Any]] = {}
+_muinmos_token_locks: Dict[Tuple[str, ...], threading.Lock] = {}
+_muinmos_token_locks_guard = threading.Lock()
+
+
+def _muinmos_token_key(grant_type: str, client_id: str, client_secret: str, username: str, password: str, api_url: str) -> Tuple[str, ...]:
+    import hashlib
+    secrets = json.dumps([client_secret, password]).encode("utf-8")
+    return (api_url, grant_type, client_id, username, hashlib.sha256(secrets).hexdigest())
+
+def _cached_muinmos_token(key: Tuple[str, ...]) -> Optional[Dict[str, Any]]:
+    entry = _muinmos_tokens.get(key)
+    if entry and entry["refresh_at"] > time.monotonic():
+        return entry["token_data"]
+    return None
+
+def get_cached_muinmos_token(grant_type: str, client_id: str, client_secret: str, username: str, password: str, api_url: str) -> Dict[str, Any]:
+    """Get Muinmos authentication token, reusing a cached one until it is close to expiry"""
+    key = _muinmos_token_key(grant_type, client_id, client_secret, username, password, api_url)
+    token_data = _cached_muinmos_token(key)
+    if token_data is not None:
+        return {"success": True, "token_data": token_data, "cached": True}
+
+    with _muinmos_token_locks_guard:
+        key_lock = _muinmos_token_locks.setdefault(key, threading.Lock())
+
+    with key_lock:
+        # Another thread may have refreshed the token while we waited
+        token_data = _cached_muinmos_token(key)
+        if token_data is not None:
+            return {"success": True, "token_data": token_data, "cached": True}
+
+        result = get_muinmos_token(grant_type, client_id, client_secret, username, password, api_url)
+        if not result.get("success"):
+            _muinmos_tokens.pop(key, None)
+            return result
+
+        token_data = result["token_data"]
+        try:
+            lifetime = float(token_data.get("expires_in") or 0)
+        except (TypeError, ValueError):
+            lifetime = 0
+        if lifetime > 0:
+            margin = min(MUINMOS_TOKEN_REFRESH_MARGIN, lifetime / 2)
+            _muinmos_tokens[key] = {
+                "token_data": token_data,
+                "refresh_at": time.monotonic() + lifetime - margin,
+            }
+        return {"success": True, "token_data": token_data, "cached": False}
+
+
+def invalidate_muinmos_token(access_token: str) -> bool:
+    """Drop a cached Muinmos token that was rejected with 401; True if it was cached"""
+    removed = False
+    with _muinmos_token_locks_guard:
+        for key, entry in list(_muinmos_tokens.items()):
+            if access_token and entry["token_data"].get("access_token") == access_token:
+                _muinmos_tokens.pop(key, None)
+                removed = True
+    if removed:
+        logger.warning("muinmos: dropped cached token rejected with 401")
+    return removed
+
+
+def muinmos_token_cached(access_token: str) -> bool:
+    with _muinmos_token_locks_guard:
+        return any(entry["token_data"].get("access_token") == access_token for entry in _muinmos_tokens.values())
+
+
+def resolve_muinmos_auth(credentials: Dict[str, Any]) -> Dict[str, Any]:
+    """Resolve Muinmos credentials into a token_type/access_token pair via the token cache"""
+    if not isinstance(credentials, dict):
+        return {"success": False, "error": "muinmos_credentials must be an object"}
+
+    result = get_cached_muinmos_token(
+        grant_type=credentials.get("grant_type") or "password",
+        client_id=credentials.get("client_id"),
+        client_secret=credentials.get("client_secret"),
+        username=credentials.get("username"),
+        password=credentials.get("password"),
+        api_url=credentials.get("api_url")
+    )
+    if not result.get("success"):
+        return result
+
+    token_data = result["token_data"]
+    if not token_data.get("access_token"):
+        return {"success": False, "error": "Token response has no access_token"}
+    return {
+        "success": True,
+        "token_type": token_data.get("token_type") or "Bearer",
+        "access_token": token_data["access_token"],
+        "cached": bool(result.get("cached"))
+    }
+
+
 def create_assessment(user_email: str, kyc_profile_id: str, order_code: str, api_url: str, token_type: str, access_token: str) -> Dict[str, Any]:
     """Create Muinmos KYC assessment"""
     if not all([user_email, kyc_profile_id, order_code, api_url, token_type, access_token]):
         return {"success": False, "error": "Missing required parameters"}
     
     try:
-        from curl_cffi import requests as curl_requests
         url = f"{api_url}/api/assessment?api-version=2.0"
         
         body_data = {
@@ -388,83 +1844,499 @@ def create_assessment(user_email: str, kyc_profile_id: str, order_code: str, api
             }
         }
 
-        resp = curl_requests.post(
+        resp = muinmos_client.post(
             url,
             json=body_data,
             headers={
                 "Content-Type": "application/json",
                 "Authorization": f"{token_type} {access_token}"
             },
-            impersonate="chrome110",
             timeout=30
         )
         if resp.status_code >= 400:
-            print(f"HTTP {resp.status_code} error body: {resp.text}")
+            logger.warning("muinmos: HTTP %s error body: %s", resp.status_code, resp.text)
             return {"success": False, "error": f"HTTP {resp.status_code}", "response_body": resp.text}
         return {"success": True, "assessment_id": resp.text}
     except Exception as e:
         return {"success": False, "error": str(e)}
 
 
-def muinmos_assessment_search(from_date: str, to_date: str, base_api_url: str, token_type: str, access_token: str) -> Dict[str, Any]:
-    """Search Muinmos assessments by date range"""
+class MuinmosError(Exception):
+    """Muinmos API returned an error status"""
+
+    def __init__(self, status_code: int, response_body: str) -> None:
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        self.response_body = response_body
+
+
+# Muinmos Search returns one page as {"items": [...], "totalCount": n}; ASP.NET
+# may serialize the names in PascalCase, so they are matched case-insensitively
+_SEARCH_ITEMS_KEY = "items"
+_SEARCH_TOTAL_KEY = "totalcount"
+
+
+def _search_page_items(page: Any) -> Tuple[list, Optional[int]]:
+    if isinstance(page, list):
+        return page, None
+    if not isinstance(page, dict):
+        raise ValueError(f"Unexpected Muinmos search page: {type(page).__name__}")
+
+    fields = {str(key).lower(): value for key, value in page.items()}
+    items = fields.get(_SEARCH_ITEMS_KEY)
+    if not isinstance(items, list):
+        # An unknown shape must not read as "no assessments"
+        raise ValueError(f"Muinmos search page has no items list (keys: {', '.join(map(str, page)) or 'none'})")
+    total = fields.get(_SEARCH_TOTAL_KEY)
+    return items, total if isinstance(total, int) and not isinstance(total, bool) else None
+
+
+def _muinmos_search_request(from_date: str, to_date: str, base_api_url: str, token_type: str, access_token: str, page_size: int, page_number: int) -> Any:
+    from datetime import datetime, timedelta
+
+    # Parse dates and adjust by 5 minutes
+    from_dt = datetime.fromisoformat(from_date.replace('Z', '+00:00'))
+    to_dt = datetime.fromisoformat(to_date.replace('Z', '+00:00'))
+
+    adjusted_from = (from_dt - timedelta(minutes=5)).strftime("%Y-%m-%dT%H:%M:%S.0000000Z")
+    adjusted_to = (to_dt + timedelta(minutes=5)).strftime("%Y-%m-%dT%H:%M:%S.0000000Z")
+
+    url = f"{base_api_url}/api/assessment/Search?organisationId=81906526&?api-version=2.0"
+
+    body_data = {
+        "partyAssessmentId": None,
+        "fromDate": adjusted_from,
+        "toDate": adjusted_to,
+        "referenceKey": None,
+        "createdBy": None,
+        "respondent": None,
+        "pageSize": page_size,
+        "pageNumber": page_number
+    }
+
+    resp = muinmos_client.post(
+        url,
+        json=body_data,
+        headers={
+            "Content-Type": "application/json",
+            "Authorization": f"{token_type} {access_token}"
+        },
+        timeout=30,
+        idempotent=True
+    )
+    if resp.status_code >= 400:
+        raise MuinmosError(resp.status_code, resp.text)
+    return resp.json()
+
+
+def iter_muinmos_assessment_search(from_date: str, to_date: str, base_api_url: str, token_type: str, access_token: str, page_size: int = MUINMOS_SEARCH_PAGE_SIZE, start_page: int = 1, max_pages: Optional[int] = None, max_workers: int = 1) -> Iterator[Tuple[int, list, bool]]:
+    """Yield (page_number, items, is_last_page) for a Muinmos assessment search.
+
+    Only one page (or one batch of max_workers pages) is held at a time. When
+    the first page reports a total row count the remaining pages are fetched
+    max_workers at a time; otherwise pages are fetched until a short page.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    def fetch(page_number: int) -> list:
+        page = _muinmos_search_request(from_date, to_date, base_api_url, token_type, access_token, page_size, page_number)
+        return _search_page_items(page)
+
+    stop_page = start_page + max_pages - 1 if max_pages else None
+    items, total = fetch(start_page)
+    last_page = -(-total // page_size) if total is not None else None
+    is_last = len(items) < page_size or (last_page is not None and start_page >= last_page)
+    yield start_page, items, is_last
+    if is_last or start_page == stop_page:
+        return
+
+    page_number = start_page + 1
+    if last_page is None or max_workers <= 1:
+        while True:
+            items, _ = fetch(page_number)
+            is_last = len(items) < page_size or page_number == last_page
+            yield page_number, items, is_last
+            if is_last or page_number == stop_page:
+                return
+            page_number += 1
+
+    final_page = min(last_page, stop_page) if stop_page else last_page
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while page_number <= final_page:
+            batch = list(range(page_number, min(page_number + max_workers, final_page + 1)))
+            for number, (items, _) in zip(batch, executor.map(fetch, batch)):
+                yield number, items, number >= last_page or len(items) < page_size
+            page_number = batch[-1] + 1
+
+
+def muinmos_assessment_search(from_date: str, to_date: str, base_api_url: str, token_type: str, access_token: str, page_size: Optional[int] = None, page_number: int = 1, max_pages: Optional[int] = None, fields: Optional[list] = None, max_workers: int = 1) -> Dict[str, Any]:
+    """Search Muinmos assessments by date range.
+
+    Without page_size the whole window is fetched in one request and the raw
+    response is returned. With page_size the search is paged: rows from up to
+    max_pages pages are returned in data (trimmed to fields, if given) along
+    with next_page_number, which is None once the last page has been read.
+    If the invocation runs out of time the pages read so far are returned
+    with incomplete set and next_page_number pointing at the first page missed.
+    """
     if not all([from_date, to_date, base_api_url, token_type, access_token]):
         return {"success": False, "error": "Missing required parameters"}
     
     try:
-        from datetime import datetime, timedelta
-        
-        # Parse dates and adjust by 5 minutes
-        from_dt = datetime.fromisoformat(from_date.replace('Z', '+00:00'))
-        to_dt = datetime.fromisoformat(to_date.replace('Z', '+00:00'))
-        
-        adjusted_from = (from_dt - timedelta(minutes=5)).strftime("%Y-%m-%dT%H:%M:%S.0000000Z")
-        adjusted_to = (to_dt + timedelta(minutes=5)).strftime("%Y-%m-%dT%H:%M:%S.0000000Z")
-        
-        url = f"{base_api_url}/api/assessment/Search?organisationId=81906526&?api-version=2.0"
-        
-        body_data = {
-            "partyAssessmentId": None,
-            "fromDate": adjusted_from,
-            "toDate": adjusted_to,
-            "referenceKey": None,
-            "createdBy": None,
-            "respondent": None,
-            "pageSize": 9999999,
-            "pageNumber": 1
-        }
-        
-        from curl_cffi import requests as curl_requests
-        resp = curl_requests.post(
-            url,
-            json=body_data,
-            headers={
-                "Content-Type": "application/json",
-                "Authorization": f"{token_type} {access_token}"
-            },
-            impersonate="chrome110",
-            timeout=30
+        if not page_size:
+            return {"success": True, "data": _muinmos_search_request(from_date, to_date, base_api_url, token_type, access_token, 9999999, 1)}
+
+        rows = []
+        next_page_number = int(page_number)
+        pages = iter_muinmos_assessment_search(
+            from_date, to_date, base_api_url, token_type, access_token,
+            page_size=int(page_size), start_page=int(page_number),
+            max_pages=int(max_pages) if max_pages else None, max_workers=int(max_workers or 1)
         )
-        if resp.status_code >= 400:
-            return {"success": False, "error": f"HTTP {resp.status_code}", "response_body": resp.text}
-        return {"success": True, "data": resp.json()}
+        try:
+            for number, items, is_last in pages:
+                if fields:
+                    items = [{field: item.get(field) for field in fields} for item in items if isinstance(item, dict)]
+                rows.extend(items)
+                next_page_number = None if is_last else number + 1
+        except DeadlineExceeded:
+            return {"success": True, "data": rows, "page_size": int(page_size), "next_page_number": next_page_number, "incomplete": True}
+        return {"success": True, "data": rows, "page_size": int(page_size), "next_page_number": next_page_number}
+    except MuinmosError as e:
+        return {"success": False, "error": str(e), "response_body": e.response_body}
     except Exception as e:
         return {"success": False, "error": str(e)}
 
 
+class KeyValueStore(ABC):
+    """Minimal persistence interface for checkpoints and caches"""
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    def put(self, key: str, value: Dict[str, Any]) -> None:
+        ...
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        ...
+
+    def sweep(self, older_than: float) -> int:
+        """Delete records last written before older_than (epoch seconds); returns how many"""
+        return 0
+
+
+class LocalFileStore(KeyValueStore):
+    """KeyValueStore keeping one JSON file per key under a local directory"""
+
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+
+    def _path(self, key: str) -> str:
+        import hashlib
+
+        return os.path.join(self.directory, hashlib.sha256(key.encode("utf-8")).hexdigest() + ".json")
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._path(key), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def put(self, key: str, value: Dict[str, Any]) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(value, f, separators=(",", ":"))
+        os.replace(tmp_path, path)
+
+    def delete(self, key: str) -> None:
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def sweep(self, older_than: float) -> int:
+        removed = 0
+        try:
+            entries = list(os.scandir(self.directory))
+        except FileNotFoundError:
+            return 0
+        for entry in entries:
+            try:
+                if entry.name.endswith(".json") and entry.stat().st_mtime < older_than:
+                    os.remove(entry.path)
+                    removed += 1
+            except FileNotFoundError:
+                pass
+        return removed
+
+
+def _default_sync_store() -> Optional[KeyValueStore]:
+    return LocalFileStore(MUINMOS_SYNC_STORE_DIR) if MUINMOS_SYNC_STORE_DIR else None
+
+
+def _assessment_fingerprint(item: Any) -> str:
+    import hashlib
+
+    return hashlib.sha1(json.dumps(item, sort_keys=True, separators=(",", ":")).encode("utf-8")).hexdigest()[:16]
+
+
+def muinmos_assessment_sync(base_api_url: str, token_type: str, access_token: str, sync_key: str = "default", from_date: Optional[str] = None, to_date: Optional[str] = None, fields: Optional[list] = None, id_field: str = "id", page_size: int = MUINMOS_SEARCH_PAGE_SIZE, max_workers: int = 1, store: Optional[KeyValueStore] = None) -> Dict[str, Any]:
+    """Search Muinmos assessments since the last sync and return only new or changed ones.
+
+    The checkpoint for sync_key holds the high-water mark (the previous
+    to_date) and a compact index of assessment id -> content fingerprint, so
+    rows repeated by overlapping windows are dropped. from_date is only used
+    when there is no checkpoint yet. Rows without a value in id_field cannot
+    be tracked, so they are skipped and counted in skipped_without_id.
+
+    Checkpoints must outlive the container, so a store is required: pass one
+    or set MUINMOS_SYNC_STORE_DIR to shared storage. There is no /tmp
+    fallback, since a per-container checkpoint would be stale on every other
+    container and assessments would be delivered again.
+    """
+    if not all([base_api_url, token_type, access_token]):
+        return {"success": False, "error": "Missing required parameters"}
+    store = store or _default_sync_store()
+    if store is None:
+        return {"success": False, "error": "MUINMOS_SYNC_STORE_DIR not configured"}
+
+    try:
+        from datetime import datetime, timezone
+
+        checkpoint_key = f"muinmos_sync:{sync_key}"
+        checkpoint = store.get(checkpoint_key) or {}
+
+        from_date = checkpoint.get("high_water_mark") or from_date
+        if not from_date:
+            return {"success": False, "error": "from_date is required for the first sync"}
+        to_date = to_date or datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+        now = time.time()
+        seen: Dict[str, list] = checkpoint.get("seen") or {}
+        changed = []
+        skipped = 0
+        pages = iter_muinmos_assessment_search(
+            from_date, to_date, base_api_url, token_type, access_token,
+            page_size=int(page_size), max_workers=int(max_workers or 1)
+        )
+        complete = True
+        try:
+            for _, items, _ in pages:
+                for item in items:
+                    if not isinstance(item, dict):
+                        continue
+                    if item.get(id_field) in (None, ""):
+                        skipped += 1
+                        continue
+                    item_id = str(item[id_field])
+                    fingerprint = _assessment_fingerprint(item)
+                    previous = seen.get(item_id)
+                    if not previous or previous[0] != fingerprint:
+                        changed.append({field: item.get(field) for field in fields} if fields else item)
+                    seen[item_id] = [fingerprint, now]
+        except DeadlineExceeded:
+            # Keep the fingerprints of what was returned but not the new
+            # high-water mark, so the next run re-reads the window and only
+            # returns the rows this one did not get to.
+            complete = False
+
+        # Forget ids that have not shown up in any window for a while
+        cutoff = now - MUINMOS_SYNC_SEEN_RETENTION
+        seen = {item_id: entry for item_id, entry in seen.items() if entry[1] >= cutoff}
+
+        high_water_mark = to_date if complete else from_date
+        store.put(checkpoint_key, {"high_water_mark": high_water_mark, "seen": seen})
+        result = {
+            "success": True,
+            "data": changed,
+            "from_date": from_date,
+            "to_date": to_date,
+            "high_water_mark": high_water_mark
+        }
+        if skipped:
+            logger.warning("muinmos: sync %s skipped %d rows without %r", sync_key, skipped, id_field)
+            result["skipped_without_id"] = skipped
+        if not complete:
+            result["incomplete"] = True
+        return result
+    except MuinmosError as e:
+        return {"success": False, "error": str(e), "response_body": e.response_body}
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+
+
+class AssessmentResultCache:
+    """Completed Muinmos assessment results keyed by base_api_url, assessment id and caller.
+
+    Completed results never change, so they are kept in an in-memory LRU
+    bounded by the total serialized size, with an optional persistent tier
+    behind it that survives cold starts.
+
+    A cache hit is served without calling Muinmos, so each entry is tied to
+    a digest of the access token that fetched it: only a caller presenting
+    the same token (which Muinmos accepted) gets the cached result. Entries
+    stop being hit once that token is replaced.
+    """
+
+    def __init__(self, max_bytes: int, store: Optional[KeyValueStore] = None) -> None:
+        from collections import OrderedDict
+
+        self.max_bytes = max_bytes
+        self.store = store
+        self._entries: "OrderedDict[Tuple[str, str, str], Tuple[Dict[str, Any], int]]" = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(base_api_url: str, assessment_id: str, access_token: str) -> Tuple[str, str, str]:
+        import hashlib
+
+        caller = hashlib.sha256(str(access_token).encode("utf-8")).hexdigest()
+        return (str(base_api_url).rstrip("/"), str(assessment_id), caller)
+
+    def get(self, base_api_url: str, assessment_id: str, access_token: str) -> Optional[Dict[str, Any]]:
+        key = self._key(base_api_url, assessment_id, access_token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return dict(entry[0])
+
+        if self.store is None:
+            return None
+        result = self.store.get(f"muinmos_result:{key[0]}:{key[1]}:{key[2]}")
+        if result is not None:
+            self._remember(key, result)
+            return dict(result)
+        return None
+
+    def put(self, base_api_url: str, assessment_id: str, access_token: str, result: Dict[str, Any]) -> None:
+        key = self._key(base_api_url, assessment_id, access_token)
+        self._remember(key, result)
+        if self.store is not None:
+            try:
+                self.store.put(f"muinmos_result:{key[0]}:{key[1]}:{key[2]}", result)
+            except Exception:
+                logger.exception("result_cache: failed to persist %s", assessment_id)
+
+    def _remember(self, key: Tuple[str, str, str], result: Dict[str, Any]) -> None:
+        size = len(json.dumps(result))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._total_bytes -= previous[1]
+            while self._entries and self._total_bytes + size > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._total_bytes -= evicted_size
+            self._entries[key] = (dict(result), size)
+            self._total_bytes += size
+
+
+assessment_result_cache = AssessmentResultCache(
+    MUINMOS_RESULT_CACHE_MAX_BYTES,
+    LocalFileStore(MUINMOS_RESULT_CACHE_DIR) if MUINMOS_RESULT_CACHE_DIR else None
+)
+
+
+class IdempotencyGuard:
+    """Suppresses duplicate deliveries of webhooks and callbacks.
+
+    Keys live in a bounded in-memory TTL cache and, optionally, in a
+    persistent KeyValueStore so duplicates landing on another warm container
+    (or after a cold start) are caught too. The persistent check is
+    best-effort: two deliveries racing in different containers can both pass.
+    Persistent records are written once, so each container sweeps the ones
+    older than the TTL every sweep_seconds.
+    """
+
+    def __init__(self, ttl_seconds: int, max_keys: int, store: Optional[KeyValueStore] = None, sweep_seconds: int = IDEMPOTENCY_SWEEP_SECONDS) -> None:
+        from collections import OrderedDict
+
+        self.ttl_seconds = ttl_seconds
+        self.max_keys = max_keys
+        self.store = store
+        self.sweep_seconds = sweep_seconds
+        self._keys: "OrderedDict[str, float]" = OrderedDict()
+        self._next_sweep = 0.0
+        self._lock = threading.Lock()
+
+    def claim(self, key: str) -> bool:
+        """Return True for the first delivery of key, False for a duplicate"""
+        now = time.time()
+        with self._lock:
+            expires_at = self._keys.get(key)
+            if expires_at is not None and expires_at > now:
+                self._keys.move_to_end(key)
+                return False
+            self._keys[key] = now + self.ttl_seconds
+            self._keys.move_to_end(key)
+            while len(self._keys) > self.max_keys:
+                self._keys.popitem(last=False)
+
+        if self.store is not None:
+            try:
+                record = self.store.get(f"idempotency:{key}")
+                if record and record.get("expires_at", 0) > now:
+                    return False
+                self.store.put(f"idempotency:{key}", {"expires_at": now + self.ttl_seconds})
+            except Exception:
+                logger.exception("idempotency: persistent store unavailable for %s", key)
+            self._sweep(now)
+        return True
+
+    def _sweep(self, now: float) -> None:
+        with self._lock:
+            if now < self._next_sweep:
+                return
+            self._next_sweep = now + self.sweep_seconds
+        try:
+            removed = self.store.sweep(now - self.ttl_seconds)
+            if removed:
+                logger.info("idempotency: swept %d expired records", removed)
+        except Exception:
+            logger.exception("idempotency: sweep failed")
+
+    def release(self, key: str) -> None:
+        """Forget key so a retried delivery is processed again"""
+        with self._lock:
+            self._keys.pop(key, None)
+        if self.store is not None:
+            try:
+                self.store.delete(f"idempotency:{key}")
+            except Exception:
+                logger.exception("idempotency: failed to release %s", key)
+
+
+idempotency_guard = IdempotencyGuard(
+    IDEMPOTENCY_TTL_SECONDS,
+    IDEMPOTENCY_MAX_KEYS,
+    LocalFileStore(IDEMPOTENCY_STORE_DIR) if IDEMPOTENCY_STORE_DIR else None
+)
+
+
 def get_muinmos_assessment_result(base_api_url: str, token_type: str, access_token: str, assessment_id: str) -> Dict[str, Any]:
-    """Get Muinmos assessment result"""
+    """Get Muinmos assessment result; a completed result is cached for the token that fetched it"""
     if not all([base_api_url, token_type, access_token, assessment_id]):
         return {"success": False, "error": "Missing required parameters"}
     
+    cached = assessment_result_cache.get(base_api_url, assessment_id, access_token)
+    if cached is not None:
+        return cached
+
     try:
         url = f"{base_api_url}/api/assessment/{assessment_id}?api-version=2.0"
         
-        from curl_cffi import requests as curl_requests
-        resp = curl_requests.get(
+        resp = muinmos_client.get(
             url,
             headers={"Authorization": f"{token_type} {access_token}"},
-            impersonate="chrome110",
             timeout=30
         )
         if resp.status_code >= 400:
@@ -502,7 +2374,7 @@ def get_muinmos_assessment_result(base_api_url: str, token_type: str, access_tok
                 elif tag_name == "DOB":
                     answers["dob"] = response_value
         
-        return {
+        extracted = {
             "success": True,
             "assessment_id": result.get("id"),
             "reference_key": result.get("referenceKey"),
@@ -510,67 +2382,130 @@ def get_muinmos_assessment_result(base_api_url: str, token_type: str, access_tok
             "ragResult": rag_result,
             "answers": answers
         }
+        assessment_result_cache.put(base_api_url, assessment_id, access_token, extracted)
+        return extracted
     except Exception as e:
         return {"success": False, "error": str(e)}
 
 
-def send_muinmos_assessment_kycpdf(base_api_url: str, token_type: str, access_token: str, assessment_list: list) -> Dict[str, Any]:
-    """Send KYC PDF assessments via email"""
+def get_muinmos_assessment_results(base_api_url: str, token_type: str, access_token: str, assessment_ids: list, max_workers: Optional[int] = None, deadline: Optional[Deadline] = None) -> Dict[str, Any]:
+    """Get Muinmos assessment results for many ids concurrently, keyed by assessment id"""
+    if not all([base_api_url, token_type, access_token, assessment_ids]):
+        return {"success": False, "error": "Missing required parameters"}
+
+    from concurrent.futures import ThreadPoolExecutor
+
+    unique_ids = list(dict.fromkeys(str(assessment_id) for assessment_id in assessment_ids))
+    workers = max(1, min(int(max_workers or MUINMOS_POOL_SIZE), len(unique_ids)))
+    deadline = deadline or request_deadline()
+
+    def fetch(assessment_id: str) -> Optional[Dict[str, Any]]:
+        # Cached results are still served once the budget is spent; new lookups are not started
+        if deadline.expired():
+            return assessment_result_cache.get(base_api_url, assessment_id, access_token)
+        return get_muinmos_assessment_result(base_api_url, token_type, access_token, assessment_id)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = dict(zip(unique_ids, executor.map(fetch, unique_ids)))
+    unprocessed = [assessment_id for assessment_id, result in results.items() if result is None]
+    for assessment_id in unprocessed:
+        results[assessment_id] = {"success": False, "error": _NOT_PROCESSED}
+    return {"success": True, "results": results, "unprocessed": unprocessed}
+
+
+def _kycpdf_email_outcome(email_result: Dict[str, Any]) -> Dict[str, Any]:
+    # OutSystems closes the order on is_pdf_sent, so a queued email is reported as queued, not sent
+    if email_result.get("queued"):
+        return {"is_pdf_sent": False, "queued": True, "email_outbox_id": email_result["outbox_id"]}
+    return {"is_pdf_sent": email_result.get("success", False)}
+
+
+def _send_kycpdf_item(base_api_url: str, token_type: str, access_token: str, item: Dict[str, Any]) -> Dict[str, Any]:
+    order_assessment_id = item.get("order_assessment_id")
+    email = item.get("email")
+    assessment_id = item.get("assessment_id")
+
+    try:
+        # Get KYC PDF from Muinmos
+        url = f"{base_api_url}/api/assessment/KYCpdf?api-version=2.0"
+        body_data = {"assessmentId": assessment_id}
+
+        resp = muinmos_client.post(
+            url,
+            json=body_data,
+            headers={
+                "Content-Type": "application/json",
+                "Authorization": f"{token_type} {access_token}"
+            },
+            timeout=120,
+            idempotent=True
+        )
+        pdf_content = resp.content
+
+        # Send email with PDF attachment
+        email_result = deliver_email(
+            to_email=email,
+            subject="Your assessment has been completed successfully.",
+            body="🎉 Thank You!</br>Your assessment has been completed successfully.</br></br>You can now download the PDF from your device.",
+            is_html=True,
+            attachment={
+                "filename": f"{assessment_id}.pdf",
+                "data": pdf_content
+            }
+        )
+
+        return {
+            "order_assessment_id": order_assessment_id,
+            **_kycpdf_email_outcome(email_result)
+        }
+    except Exception as e:
+        return {
+            "order_assessment_id": order_assessment_id,
+            "is_pdf_sent": False,
+            "error": str(e)
+        }
+
+
+def send_muinmos_assessment_kycpdf(base_api_url: str, token_type: str, access_token: str, assessment_list: list, max_workers: Optional[int] = None, deadline: Optional[Deadline] = None) -> Dict[str, Any]:
+    """Send KYC PDF assessments via email, up to max_workers at a time"""
     if not all([base_api_url, token_type, access_token, assessment_list]):
         return {"success": False, "error": "Missing required parameters"}
-    
-    import base64
-    send_email_result_list = []
-    
-    for item in assessment_list:
-        order_assessment_id = item.get("order_assessment_id")
-        email = item.get("email")
-        assessment_id = item.get("assessment_id")
-        
-        try:
-            # Get KYC PDF from Muinmos
-            url = f"{base_api_url}/api/assessment/KYCpdf?api-version=2.0"
-            body_data = {"assessmentId": assessment_id}
-            
-            from curl_cffi import requests as curl_requests
-            resp = curl_requests.post(
-                url,
-                json=body_data,
-                headers={
-                    "Content-Type": "application/json",
-                    "Authorization": f"{token_type} {access_token}"
-                },
-                impersonate="chrome110",
-                timeout=120
-            )
-            pdf_content = resp.content
-            
-            # Send email with PDF attachment
-            email_result = send_email(
-                to_email=email,
-                subject="Your assessment has been completed successfully.",
-                body="🎉 Thank You!</br>Your assessment has been completed successfully.</br></br>You can now download the PDF from your device.",
-                is_html=True,
-                attachment={
-                    "filename": f"{assessment_id}.pdf",
-                    "content": base64.b64encode(pdf_content).decode("utf-8")
-                }
-            )
-            
-            send_email_result_list.append({
-                "order_assessment_id": order_assessment_id,
-                "is_pdf_sent": email_result.get("success", False)
-            })
-            
-        except Exception as e:
-            send_email_result_list.append({
-                "order_assessment_id": order_assessment_id,
-                "is_pdf_sent": False,
-                "error": str(e)
-            })
-    
-    print("Email sending results:", send_email_result_list)
-    return {"success": True, "results": send_email_result_list}
+
+    from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+    workers = max(1, int(max_workers or KYCPDF_MAX_WORKERS))
+    send_email_result_list: list = [None] * len(assessment_list)
+    next_index = 0
+
+    deadline = deadline or request_deadline()
+
+    def low_on_time() -> bool:
+        return deadline.remaining() * 1000 < KYCPDF_MIN_REMAINING_MS
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending: Dict[Any, int] = {}
+        while True:
+            # Keep the pool full, but stop scheduling once the invocation is close to its timeout
+            while next_index < len(assessment_list) and len(pending) < workers and not low_on_time():
+                future = executor.submit(_send_kycpdf_item, base_api_url, token_type, access_token, assessment_list[next_index])
+                pending[future] = next_index
+                next_index += 1
+            if not pending:
+                break
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                send_email_result_list[pending.pop(future)] = future.result()
+
+    unprocessed = [item.get("order_assessment_id") for item in assessment_list[next_index:]]
+    for index in range(next_index, len(assessment_list)):
+        send_email_result_list[index] = {
+            "order_assessment_id": assessment_list[index].get("order_assessment_id"),
+            "is_pdf_sent": False,
+            "error": _NOT_PROCESSED
+        }
+
+    logger.info("kycpdf: email sending results: %s", send_email_result_list)
+    return {"success": True, "results": send_email_result_list, "unprocessed": unprocessed}
 
 
 def send_muinmos_assessment_kycpdf_single_user(base_api_url: str, token_type: str, access_token: str, email: str, assessment_id: str) -> Dict[str, Any]:
@@ -578,41 +2513,38 @@ def send_muinmos_assessment_kycpdf_single_user(base_api_url: str, token_type: st
     if not all([base_api_url, token_type, access_token, email, assessment_id]):
         return {"success": False, "error": "Missing required parameters"}
     
-    import base64
-    
     try:
         # Get KYC PDF from Muinmos
         url = f"{base_api_url}/api/assessment/KYCpdf?api-version=2.0"
         body_data = {"assessmentId": assessment_id}
         
-        from curl_cffi import requests as curl_requests
-        resp = curl_requests.post(
+        resp = muinmos_client.post(
             url,
             json=body_data,
             headers={
                 "Content-Type": "application/json",
                 "Authorization": f"{token_type} {access_token}"
             },
-            impersonate="chrome110",
-            timeout=120
+            timeout=120,
+            idempotent=True
         )
         pdf_content = resp.content
         
         # Send email with PDF attachment
-        email_result = send_email(
+        email_result = deliver_email(
             to_email=email,
             subject="Your assessment has been completed successfully.",
             body="🎉 Thank You!</br>Your assessment has been completed successfully.</br></br>You can now download the PDF from your device.",
             is_html=True,
             attachment={
                 "filename": f"{assessment_id}.pdf",
-                "content": base64.b64encode(pdf_content).decode("utf-8")
+                "data": pdf_content
             }
         )
         
         return {
             "success": True,
-            "is_pdf_sent": email_result.get("success", False)
+            **_kycpdf_email_outcome(email_result)
         }
     except Exception as e:
         return {
@@ -621,6 +2553,26 @@ def send_muinmos_assessment_kycpdf_single_user(base_api_url: str, token_type: st
             "error": str(e)
         }
 
+def _forward_assessment_completion(event_type: Any, assessment_id: Any, reference_key: Any) -> bool:
+    """Ask the target Lambda to process a completed assessment; False if already forwarded"""
+    # Same key for both callback paths, so one completion triggers one report
+    key = f"muinmos:{assessment_id}:{event_type}"
+    if not idempotency_guard.claim(key):
+        logger.info("muinmos_callback: duplicate notification %s; skipping", key)
+        return False
+
+    try:
+        _invoke_target_lambda(json.dumps({
+            "action": "update_order_assessment_iscomplete_sendpdfreport",
+            "event_type": event_type,
+            "assessment_id": assessment_id,
+            "reference_key": reference_key
+        }), "Event")
+    except Exception:
+        idempotency_guard.release(key)
+    return True
+
+
 def muinmos_callback_from_outsystem(event: Dict[str, Any]) -> Dict[str, Any]:
     """Handle Muinmos callback events"""
     try:
@@ -649,28 +2601,19 @@ def muinmos_callback_from_outsystem(event: Dict[str, Any]) -> Dict[str, Any]:
         reference_key = payload.get("reference_key")
         
         # Invoke lambda if event_type is "0"
+        duplicate = False
         if event_type == "0" and WEBHOOK_TARGET_LAMBDA_ARN:
-            try:
-                lambda_client = boto3.client("lambda")
-                lambda_client.invoke(
-                    FunctionName=WEBHOOK_TARGET_LAMBDA_ARN,
-                    InvocationType="Event",
-                    Payload=json.dumps({
-                        "action": "update_order_assessment_iscomplete_sendpdfreport",
-                        "event_type": event_type,
-                        "assessment_id": assessment_id,
-                        "reference_key": reference_key
-                    })
-                )
-            except Exception:
-                pass
+            duplicate = not _forward_assessment_completion(event_type, assessment_id, reference_key)
         
-        return {
+        result = {
             "success": True,
             "event_type": event_type,
             "assessment_id": assessment_id,
             "reference_key": reference_key
         }
+        if duplicate:
+            result["duplicate"] = True
+        return result
     except Exception as e:
         return {"success": False, "error": str(e)}
 
@@ -683,10 +2626,8 @@ def get_muinmos_question(base_api_url: str, assessment_id: str) -> Dict[str, Any
     try:
         url = f"{base_api_url}/api/assessment/{assessment_id}/question?api-version=2.0"
         
-        from curl_cffi import requests as curl_requests
-        resp = curl_requests.get(
+        resp = muinmos_client.get(
             url,
-            impersonate="chrome110",
             timeout=30
         )
         if resp.status_code >= 400:
@@ -704,15 +2645,13 @@ def submit_muinmos_answer(base_api_url: str, token_type: str, access_token: str,
     try:
         url = f"{base_api_url}/api/assessment/{assessment_id}/question?api-version=2.0"
         
-        from curl_cffi import requests as curl_requests
-        resp = curl_requests.post(
+        resp = muinmos_client.post(
             url,
             json=answer,
             headers={
                 "Content-Type": "application/json",
                 "Authorization": f"{token_type} {access_token}"
             },
-            impersonate="chrome110",
             timeout=30
         )
         if resp.status_code >= 400:
@@ -763,30 +2702,21 @@ def muinmos_callback_directly(event: Dict[str, Any]) -> Dict[str, Any]:
         assessment_id = payload.get("id")
         reference_key = payload.get("referenceKey")
 
+        duplicate = False
         if notification_type in ("0", 0) and WEBHOOK_TARGET_LAMBDA_ARN:
-            try:
-                lambda_client = boto3.client("lambda")
-                lambda_client.invoke(
-                    FunctionName=WEBHOOK_TARGET_LAMBDA_ARN,
-                    InvocationType="Event",
-                    Payload=json.dumps({
-                        "action": "update_order_assessment_iscomplete_sendpdfreport",
-                        "event_type": notification_type,
-                        "assessment_id": assessment_id,
-                        "reference_key": reference_key
-                    })
-                )
-            except Exception:
-                pass
+            duplicate = not _forward_assessment_completion(notification_type, assessment_id, reference_key)
 
-        return _http_response(200, {
+        result = {
             "success": True,
             "organisation_id": organisation_id,
             "profile_id": profile_id,
             "notification_type": notification_type,
             "assessment_id": assessment_id,
             "reference_key": reference_key
-        })
+        }
+        if duplicate:
+            result["duplicate"] = True
+        return _http_response(200, result)
     except Exception as e:
         return _http_response(200, {"success": False, "error": str(e)})
 
@@ -804,15 +2734,19 @@ def submit_contact_us(to_email: str, subject: str, body: str, is_html: bool = Fa
             "secret": RECAPTCHA_SECRET_KEY,
             "response": recaptcha_token
         }).encode("utf-8")
-        req = urllib.request.Request("https://www.google.com/recaptcha/api/siteverify", data=verify_data, method="POST")
+        req = urllib.request.Request(RECAPTCHA_VERIFY_URL, data=verify_data, method="POST")
         req.add_header("Content-Type", "application/x-www-form-urlencoded")
-        with urllib.request.urlopen(req, timeout=10) as resp:
-            result = json.loads(resp.read().decode("utf-8"))
+        with metrics.span("recaptcha", "POST /recaptcha/api/siteverify", len(verify_data)) as span:
+            with urllib.request.urlopen(req, timeout=request_deadline().timeout(10)) as resp:
+                response_body = resp.read()
+                span["status"] = resp.status
+                span["bytes_in"] = len(response_body)
+        result = json.loads(response_body.decode("utf-8"))
 
         if not result.get("success"):
             return {"success": False, "error": "reCAPTCHA verification failed"}
 
         # return send_email_smtp(to_email=to_email, subject=subject, body=body, is_html=is_html, attachment=attachment)
-        return send_email(to_email=to_email, subject=subject, body=body, is_html=is_html, attachment=attachment)
+        return deliver_email(to_email=to_email, subject=subject, body=body, is_html=is_html, attachment=attachment)
     except Exception as e:
         return {"success": False, "error": str(e)}
\ No newline at end of file
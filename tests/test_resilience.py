@@ -0,0 +1,214 @@
+import pytest
+
+import main
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class FakeResponse:
+    def __init__(self, status_code: int, headers: dict = None) -> None:
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.content = b"{}"
+
+
+class FakeSession:
+    def __init__(self, responses: list) -> None:
+        self.responses = list(responses)
+        self.calls = 0
+
+    def request(self, method, url, **kwargs):
+        self.calls += 1
+        return self.responses.pop(0)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(main.time, "monotonic", clock.monotonic)
+    monkeypatch.setattr(main.time, "sleep", clock.sleep)
+    return clock
+
+
+def _open(breaker):
+    for _ in range(breaker.failure_threshold):
+        breaker.before_call()
+        breaker.record(False)
+
+
+def test_breaker_stays_closed_below_threshold(clock):
+    breaker = main.CircuitBreaker("test", failure_threshold=3, reset_seconds=10)
+    for _ in range(2):
+        breaker.before_call()
+        breaker.record(False)
+    breaker.before_call()
+    breaker.record(True)
+    for _ in range(2):
+        breaker.before_call()
+        breaker.record(False)
+
+    assert breaker.state == breaker.CLOSED
+
+
+def test_breaker_opens_after_consecutive_failures(clock):
+    breaker = main.CircuitBreaker("test", failure_threshold=3, reset_seconds=10)
+    _open(breaker)
+
+    assert breaker.state == breaker.OPEN
+    with pytest.raises(main.CircuitOpenError):
+        breaker.before_call()
+
+
+def test_breaker_half_open_allows_one_probe(clock):
+    breaker = main.CircuitBreaker("test", failure_threshold=2, reset_seconds=10)
+    _open(breaker)
+    clock.now += 10
+
+    breaker.before_call()
+
+    assert breaker.state == breaker.HALF_OPEN
+    with pytest.raises(main.CircuitOpenError):
+        breaker.before_call()
+
+
+def test_breaker_probe_success_closes(clock):
+    breaker = main.CircuitBreaker("test", failure_threshold=2, reset_seconds=10)
+    _open(breaker)
+    clock.now += 10
+    breaker.before_call()
+    breaker.record(True)
+
+    assert breaker.state == breaker.CLOSED
+    breaker.before_call()
+
+
+def test_breaker_probe_failure_reopens(clock):
+    breaker = main.CircuitBreaker("test", failure_threshold=2, reset_seconds=10)
+    _open(breaker)
+    clock.now += 10
+    breaker.before_call()
+    breaker.record(False)
+
+    assert breaker.state == breaker.OPEN
+    with pytest.raises(main.CircuitOpenError):
+        breaker.before_call()
+    clock.now += 10
+    breaker.before_call()
+    assert breaker.state == breaker.HALF_OPEN
+
+
+def test_breaker_probe_without_outcome_frees_the_slot(clock):
+    breaker = main.CircuitBreaker("test", failure_threshold=2, reset_seconds=10)
+    _open(breaker)
+    clock.now += 10
+    breaker.before_call()
+    breaker.record(None)
+
+    assert breaker.state == breaker.HALF_OPEN
+    breaker.before_call()
+
+
+def test_client_session_failure_does_not_take_the_probe_slot(clock, monkeypatch):
+    monkeypatch.setitem(main.rate_limiters, "muinmos", main.TokenBucket(0))
+    client = main.MuinmosClient(pool_size=1)
+    url = "https://muinmos.test/api/assessment/abc"
+    breaker = client._breaker(f"https://muinmos.test {main._span_operation('GET', url)}")
+    _open(breaker)
+    clock.now += breaker.reset_seconds
+
+    def broken_acquire(base_url):
+        raise RuntimeError("no curl handle")
+
+    monkeypatch.setattr(client, "_acquire", broken_acquire)
+    with pytest.raises(RuntimeError):
+        client.get(url)
+
+    session = FakeSession([FakeResponse(200)])
+    monkeypatch.setattr(client, "_acquire", lambda base_url: session)
+    monkeypatch.setattr(client, "_release", lambda base_url, session: None)
+    assert client.get(url).status_code == 200
+    assert breaker.state == breaker.CLOSED
+
+
+def test_bucket_without_rate_does_not_wait(clock):
+    bucket = main.TokenBucket(0)
+    for _ in range(100):
+        bucket.acquire()
+
+    assert clock.sleeps == []
+
+
+def test_bucket_without_rate_honours_defer(clock):
+    bucket = main.TokenBucket(0)
+    bucket.defer(2.5)
+    bucket.acquire()
+
+    assert sum(clock.sleeps) == pytest.approx(2.5)
+
+
+def test_bucket_spaces_calls_at_the_rate(clock):
+    bucket = main.TokenBucket(4, burst=2)
+    for _ in range(6):
+        bucket.acquire()
+
+    assert sum(clock.sleeps) == pytest.approx(1.0)
+
+
+def test_bucket_defer_holds_back_and_drains_tokens(clock):
+    bucket = main.TokenBucket(2, burst=5)
+    bucket.defer(3)
+    bucket.acquire()
+
+    # The deferral is waited out, then the emptied bucket refills at the rate
+    assert clock.now - 1000.0 == pytest.approx(3.5)
+
+
+def test_throttle_delay_uses_retry_after_up_to_the_cap():
+    assert main._throttle_delay(0, "1.5") == 1.5
+    assert main._throttle_delay(0, "100000") == main.THROTTLE_MAX_BACKOFF
+    assert main._throttle_delay(0, "-3") == 0.0
+
+
+@pytest.mark.parametrize("attempt", [0, 1, 2, 6])
+def test_throttle_delay_without_retry_after_is_jittered_and_bounded(attempt):
+    for _ in range(50):
+        assert 0 <= main._throttle_delay(attempt, "soon") <= min(main.THROTTLE_MAX_BACKOFF, 0.5 * 2 ** attempt)
+
+
+def test_client_backs_off_on_429(clock, monkeypatch):
+    monkeypatch.setitem(main.rate_limiters, "muinmos", main.TokenBucket(0))
+    client = main.MuinmosClient(pool_size=1)
+    session = FakeSession([FakeResponse(429, {"Retry-After": "2"}), FakeResponse(429, {"Retry-After": "3"}), FakeResponse(200)])
+    monkeypatch.setattr(client, "_acquire", lambda base_url: session)
+    monkeypatch.setattr(client, "_release", lambda base_url, session: None)
+
+    resp = client.post("https://muinmos.test/api/assessment", json={})
+
+    assert resp.status_code == 200
+    assert session.calls == 3
+    assert clock.sleeps == pytest.approx([2, 3])
+
+
+def test_client_gives_up_after_throttle_retries(clock, monkeypatch):
+    monkeypatch.setitem(main.rate_limiters, "muinmos", main.TokenBucket(0))
+    monkeypatch.setattr(main, "THROTTLE_MAX_RETRIES", 2)
+    client = main.MuinmosClient(pool_size=1)
+    session = FakeSession([FakeResponse(429, {"Retry-After": "1"})] * 5)
+    monkeypatch.setattr(client, "_acquire", lambda base_url: session)
+    monkeypatch.setattr(client, "_release", lambda base_url, session: None)
+
+    resp = client.get("https://muinmos.test/api/assessment/abc")
+
+    assert resp.status_code == 429
+    assert session.calls == 3
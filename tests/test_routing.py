@@ -0,0 +1,59 @@
+import json
+
+import pytest
+
+import lambda_function
+
+
+@pytest.mark.parametrize("event, expected", [
+    # Direct invocation
+    ({"route": "muinmosCallbackFromOutsystem"}, "muinmoscallbackfromoutsystem"),
+    ({}, "createcheckoutsession"),
+    # REST API (payload v1): resource, then path
+    ({"resource": "/stripeWebhook", "path": "/prod/stripeWebhook", "httpMethod": "POST"}, "stripewebhook"),
+    ({"resource": "/stripe/webhook/", "path": "/stripe/webhook/"}, "stripewebhook"),
+    ({"resource": "/{proxy+}", "path": "/sendEmailSMTP"}, "sendemailsmtp"),
+    ({"resource": "/{proxy+}", "path": "/prod/sendEmail"}, "sendemail"),
+    ({"resource": "/{proxy+}", "path": "/"}, "createcheckoutsession"),
+    ({"resource": "/api/sendEmail/{proxy+}", "path": "/api/sendEmail/anything"}, "sendemail"),
+    # HTTP API (payload v2): routeKey, then rawPath
+    ({"routeKey": "POST /submitContactUs", "rawPath": "/prod/submitContactUs"}, "submitcontactus"),
+    ({"routeKey": "POST /prod/sendEmailSMTP", "rawPath": "/prod/sendEmailSMTP"}, "sendemailsmtp"),
+    ({"routeKey": "POST /api/sendEmail/{proxy+}", "rawPath": "/api/sendEmail/v1"}, "sendemail"),
+    ({"routeKey": "ANY /checkout-session", "rawPath": "/checkout-session"}, "checkoutsession"),
+    ({"routeKey": "POST /createCheckoutSession"}, "createcheckoutsession"),
+    ({"routeKey": "$default", "rawPath": "/"}, "createcheckoutsession"),
+    ({"routeKey": "$default", "rawPath": ""}, "createcheckoutsession"),
+    ({"routeKey": "$default", "rawPath": "/muinmosCallbackDirectly"}, "muinmoscallbackdirectly"),
+    ({"routeKey": "$default", "rawPath": "/not/a/route"}, "createcheckoutsession"),
+    # Trailing segments after the route name, as the old substring match allowed
+    ({"path": "/api/sendemail/v1"}, "sendemail"),
+    ({"rawPath": "/prod/sendEmailSMTP/v2"}, "sendemailsmtp"),
+    # Named routes that are not registered
+    ({"routeKey": "POST /unknown"}, "unknown_route"),
+    ({"resource": "/{proxy+}", "path": "/prod/unknown"}, "unknown_route"),
+])
+def test_resolve_route(event, expected):
+    name, handler = lambda_function._resolve_route(event)
+
+    assert name == expected
+    if expected in lambda_function._ROUTES:
+        assert handler is lambda_function._ROUTES[expected]
+
+
+@pytest.mark.parametrize("route_key, expected", [
+    ("POST /prod/stripe/webhook/", ["webhook", "stripewebhook", "prodstripewebhook", "stripe", "prodstripe", "prod"]),
+    ("/api/sendEmail/{proxy+}", ["sendemail", "apisendemail", "api"]),
+    ("$default", ["default"]),
+    ("/", []),
+    ("", []),
+])
+def test_route_candidates(route_key, expected):
+    assert list(lambda_function._route_candidates(route_key)) == expected
+
+
+def test_unknown_route_returns_404():
+    response = lambda_function._dispatch_route({"routeKey": "POST /unknown"}, None)
+
+    assert response["statusCode"] == 404
+    assert json.loads(response["body"]) == {"error": "Unknown route: POST /unknown"}
@@ -0,0 +1,112 @@
+import hashlib
+import hmac
+import itertools
+import json
+import time
+
+import pytest
+
+import main
+
+WEBHOOK_SECRET = "whsec_test"
+_event_ids = itertools.count(1)
+
+
+def _signed_event(body: str) -> dict:
+    timestamp = int(time.time())
+    signature = hmac.new(WEBHOOK_SECRET.encode(), f"{timestamp}.{body}".encode(), hashlib.sha256).hexdigest()
+    return {"body": body, "headers": {"stripe-signature": f"t={timestamp},v1={signature}"}}
+
+
+@pytest.fixture(autouse=True)
+def webhook_config(monkeypatch):
+    monkeypatch.setattr(main, "STRIPE_WEBHOOK_SECRET", WEBHOOK_SECRET)
+    monkeypatch.setattr(main, "WEBHOOK_TARGET_LAMBDA_ARN", "")
+    monkeypatch.setattr(main, "STRIPE_WEBHOOK_RESPONSE_OBJECT", True)
+
+
+def test_parse_keeps_raw_object_with_braces_inside_strings():
+    payload = '{"id": "evt_1", "data": {"object": {"description": "a } b {", "nested": {"s": "}}"}, "list": ["}"]}, "previous": "}"}, "type": "x"}'
+
+    stripe_event, object_json = main._parse_stripe_event(payload)
+
+    assert stripe_event == json.loads(payload)
+    assert object_json == '{"description": "a } b {", "nested": {"s": "}}"}, "list": ["}"]}'
+
+
+def test_parse_null_object():
+    stripe_event, object_json = main._parse_stripe_event('{"id": "evt_1", "data": {"object": null}}')
+
+    assert stripe_event["data"] == {"object": None}
+    assert object_json == "null"
+
+
+def test_parse_missing_object():
+    stripe_event, object_json = main._parse_stripe_event('{"id": "evt_1", "data": {"previous_attributes": {}}}')
+
+    assert stripe_event["data"] == {"previous_attributes": {}}
+    assert object_json == "{}"
+
+
+@pytest.mark.parametrize("data", ['"text"', "[1, 2]", "null", "3"])
+def test_parse_data_that_is_not_an_object(data):
+    stripe_event, object_json = main._parse_stripe_event(f'{{"id": "evt_1", "data": {data}}}')
+
+    assert stripe_event["data"] == json.loads(data)
+    assert object_json == "{}"
+
+
+def test_parse_non_ascii_text():
+    payload = json.dumps({"id": "evt_1", "data": {"object": {"name": "Zoë Ñandú 名前 🎉", "escaped": "é"}}}, ensure_ascii=False)
+
+    stripe_event, object_json = main._parse_stripe_event(payload)
+
+    assert stripe_event == json.loads(payload)
+    assert object_json == json.dumps({"name": "Zoë Ñandú 名前 🎉", "escaped": "é"}, ensure_ascii=False)
+
+
+@pytest.mark.parametrize("payload", [
+    "",
+    "[]",
+    '{"id": "evt_1"',
+    '{"id": "evt_1", "data": {"object": {"a": 1}}',
+    '{"id": "evt_1",}',
+    '{"id" "evt_1"}',
+    "{'id': 'evt_1'}",
+    '{"id": "evt_1"} trailing',
+])
+def test_parse_rejects_malformed_input(payload):
+    with pytest.raises((ValueError, IndexError)):
+        main._parse_stripe_event(payload)
+
+
+def test_webhook_returns_raw_object():
+    event_id = f"evt_test_{next(_event_ids)}"
+    body = json.dumps({"id": event_id, "type": "checkout.session.completed", "data": {"object": {"note": "}{ ✓"}}}, ensure_ascii=False)
+
+    response = main.stripe_webhook(_signed_event(body))
+
+    assert response["statusCode"] == 200
+    assert json.loads(response["body"]) == {
+        "received": True,
+        "event_type": "checkout.session.completed",
+        "event_id": event_id,
+        "object": {"note": "}{ ✓"},
+    }
+
+
+def test_webhook_returns_400_for_malformed_payload():
+    response = main.stripe_webhook(_signed_event('{"id": "evt_bad", "data": {"object": '))
+
+    assert response["statusCode"] == 400
+    assert json.loads(response["body"])["error"] == "Invalid webhook payload"
+
+
+def test_webhook_returns_400_for_bad_signature():
+    event = _signed_event('{"id": "evt_forged", "data": {"object": {}}}')
+    event["body"] = event["body"].replace("forged", "altered")
+
+    response = main.stripe_webhook(event)
+
+    assert response["statusCode"] == 400
+    assert json.loads(response["body"])["error"] == "Invalid webhook signature"